@@ -5,6 +5,21 @@
 #name2:sheer galor
 #username2:Sheerg1
 
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import accumulate, groupby, repeat
+from operator import itemgetter
+from time import perf_counter_ns
+
+try:
+    import numpy
+except ImportError: # search_many then takes and returns lists only
+    numpy = None
 
 """A class represnting a node in an AVL tree"""
 
@@ -16,6 +31,10 @@ class AVLNode(object):
     @type value: string
     @param value: data of your node
     """
+    __slots__ = ('key', 'value', 'left', 'right', 'parent', 'height', 'size', 'pred', 'succ')
+
+    count = 1 # occurrences of key; a field of its own only in _CountedNode, for trees with duplicates
+
     def __init__(self, key=None, value=None, parent=None):
         self.key = key
         self.value = value
@@ -23,6 +42,9 @@ class AVLNode(object):
         self.right : AVLNode = None
         self.parent : AVLNode = parent
         self.height = -1
+        self.size = 0 # number of items in the subtree of self, counting every occurrence of a key
+        self.pred : AVLNode = None # in-order neighbours, threaded through the whole tree
+        self.succ : AVLNode = None
         
 
     """returns whether self is not a virtual node 
@@ -35,9 +57,231 @@ class AVLNode(object):
     def update_height(self):
         self.height = 1 + max(self.left.height, self.right.height)
 
+    def update(self):
+        """Recomputes the height and the subtree size of self from its children."""
+        self.height = 1 + max(self.left.height, self.right.height)
+        self.size = self.count + self.left.size + self.right.size
+
     def get_balance(self):
         return self.left.height - self.right.height
 
+    """returns the node with the next larger key, in O(1)
+    @rtype: AVLNode
+    @returns: the successor of self, None if self holds the maximal key
+    """
+    def next(self):
+        return self.succ
+
+    """returns the node with the next smaller key, in O(1)
+    @rtype: AVLNode
+    @returns: the predecessor of self, None if self holds the minimal key
+    """
+    def prev(self):
+        return self.pred
+
+
+"""The virtual leaf shared by every empty child slot in every tree"""
+
+class _VirtualNode(AVLNode):
+    """Immutable sentinel: real nodes point at the single instance _VIRTUAL instead of
+    allocating a virtual child of their own, so it can never hold a parent pointer.
+    """
+    __slots__ = ()
+
+    count = 0 # an empty subtree holds no occurrences
+
+    def __init__(self):
+        for name in AVLNode.__slots__:
+            object.__setattr__(self, name, None)
+        object.__setattr__(self, 'height', -1)
+        object.__setattr__(self, 'size', 0)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("the virtual node is shared and cannot be modified")
+
+_VIRTUAL = _VirtualNode()
+
+"""Nodes of trees with options that need more fields; a tree picks its class once, so plain
+trees pay for none of them"""
+
+class _AggregateNode(AVLNode):
+    """A node of a tree created with combine: agg holds the combined values of its subtree."""
+    __slots__ = ('agg',)
+
+    def __init__(self, key=None, value=None, parent=None):
+        AVLNode.__init__(self, key, value, parent)
+        self.agg = None
+
+class _CountedNode(AVLNode):
+    """A node of a tree created with duplicates: count is the number of occurrences of key."""
+    __slots__ = ('count',)
+
+    def __init__(self, key=None, value=None, parent=None):
+        AVLNode.__init__(self, key, value, parent)
+        self.count = 1
+
+class _KeyedNode(AVLNode):
+    """key caches key_func(record), computed once when the node is created, and every
+    comparison in the tree uses it; record is the key as it was passed to the tree.
+    """
+    __slots__ = ('record',)
+
+    def __init__(self, key=None, value=None, parent=None):
+        AVLNode.__init__(self, key, value, parent)
+        self.record = None
+
+class _KeyedAggregateNode(_AggregateNode):
+    """A node of a tree created with both combine and a key function, see _KeyedNode."""
+    __slots__ = ('record',)
+
+    def __init__(self, key=None, value=None, parent=None):
+        _AggregateNode.__init__(self, key, value, parent)
+        self.record = None
+
+def _take_second(first, second):
+    """The default merge of set operations: the value from the second tree wins."""
+    return second
+
+def _merge_records(merge, first, second):
+    """Merges the (record, value) batch values of keyed trees, keeping the first record."""
+    return first[0], (merge or _take_second)(first[1], second[1])
+
+def _group_values(items):
+    """Groups (key, value) pairs sorted by key into (key, [values]) pairs, keeping the order of the values."""
+    return [(key, [val for _, val in group]) for key, group in groupby(items, key=itemgetter(0))]
+
+"""Counters and timings collected by AVLTree.enable_stats"""
+
+class AVLTreeStats(object):
+    """Cumulative statistics of one tree.
+
+    counts maps every instrumented operation (e.g. 'insert') and internal event ('rotations',
+    'height_updates', 'min_max_walks') to the number of times it happened. With timing, histograms
+    maps every operation to {b: count of calls that took between 2^(b-1) and 2^b nanoseconds}.
+    """
+    __slots__ = ('counts', 'histograms', 'hook')
+
+    def __init__(self, timing=False, hook=None):
+        self.counts = {}
+        self.histograms = {} if timing else None
+        self.hook = hook
+
+    def snapshot(self):
+        """Returns a copy of the counters and histograms as plain dicts, e.g. for exporting."""
+        snapshot = {'counts': dict(self.counts)}
+        if self.histograms is not None:
+            snapshot['histograms'] = {name: dict(buckets) for name, buckets in self.histograms.items()}
+        return snapshot
+
+def _counted(method, counts, event):
+    """Wraps a bound method to count its calls under event."""
+    def counted(*args, **kwargs):
+        counts[event] = counts.get(event, 0) + 1
+        return method(*args, **kwargs)
+    return counted
+
+def _counted_min_max(method, counts):
+    """Wraps _update_min_max to count the calls that walk down to the extremes."""
+    def counted(new_node=None):
+        if new_node is None:
+            counts['min_max_walks'] = counts.get('min_max_walks', 0) + 1
+        return method(new_node)
+    return counted
+
+def _timed(method, stats, operation):
+    """Wraps a bound public method to count its calls and, if asked, time them and report to the hook."""
+    counts, histograms, hook = stats.counts, stats.histograms, stats.hook
+    if histograms is None and hook is None:
+        return _counted(method, counts, operation)
+    def timed(*args, **kwargs):
+        counts[operation] = counts.get(operation, 0) + 1
+        start = perf_counter_ns()
+        result = method(*args, **kwargs)
+        elapsed = perf_counter_ns() - start
+        if histograms is not None:
+            buckets = histograms.setdefault(operation, {})
+            bucket = elapsed.bit_length()
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+        if hook is not None:
+            hook(operation, elapsed / 1e9)
+        return result
+    return timed
+
+"""File format of save/load: a header, then the keys and the values as two length-prefixed columns"""
+_FILE_MAGIC = b'AVLT'
+_FILE_VERSION = 2
+_FILE_HEADER = struct.Struct('<4sHBBQ') # magic, version, key encoding, value encoding, item count
+_FILE_DUPLICATES = struct.Struct('<B') # since version 2: the duplicates option, an index into _DUPLICATE_MODES
+_DUPLICATE_MODES = (None, 'count', 'bucket')
+_COLUMN_LENGTH = struct.Struct('<Q')
+_INT64_COLUMN, _STR_COLUMN, _PICKLE_COLUMN = 0, 1, 2
+
+def _encode_column(column):
+    """Returns (encoding, bytes) of a list: little-endian int64s, length-prefixed utf-8 strings,
+    or a single pickle of the list for anything else. O(n)."""
+    if all(type(item) is int and -2 ** 63 <= item < 2 ** 63 for item in column):
+        numbers = array('q', column)
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+        return _INT64_COLUMN, numbers.tobytes()
+    if all(type(item) is str for item in column):
+        encoded = [item.encode('utf-8') for item in column]
+        lengths = array('Q', map(len, encoded))
+        if sys.byteorder == 'big':
+            lengths.byteswap()
+        return _STR_COLUMN, lengths.tobytes() + b''.join(encoded)
+    return _PICKLE_COLUMN, pickle.dumps(column, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _decode_column(encoding, data, count):
+    """Inverse of _encode_column - O(n)."""
+    if encoding == _INT64_COLUMN:
+        numbers = array('q')
+        numbers.frombytes(data)
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+        return numbers.tolist()
+    if encoding == _STR_COLUMN:
+        lengths = array('Q')
+        lengths.frombytes(data[:8 * count])
+        if sys.byteorder == 'big':
+            lengths.byteswap()
+        column, offset = [], 8 * count
+        for length in lengths:
+            column.append(str(data[offset:offset + length], 'utf-8'))
+            offset += length
+        return column
+    if encoding == _PICKLE_COLUMN:
+        return pickle.loads(data)
+    raise ValueError("unknown column encoding %d" % encoding)
+
+def _merge_items(operation, items1, items2, merge):
+    """Linear merge of two lists of (key, value) pairs sorted by key, run on worker processes
+    by the parallel set operations. O(len(items1) + len(items2))."""
+    if merge is None:
+        merge = _take_second
+    result = []
+    i = j = 0
+    while i < len(items1) and j < len(items2):
+        key1, key2 = items1[i][0], items2[j][0]
+        if key1 < key2:
+            if operation != "intersection":
+                result.append(items1[i])
+            i += 1
+        elif key2 < key1:
+            if operation == "union":
+                result.append(items2[j])
+            j += 1
+        else:
+            if operation != "difference":
+                result.append((key1, merge(items1[i][1], items2[j][1])))
+            i += 1
+            j += 1
+    if operation != "intersection":
+        result.extend(items1[i:])
+    if operation == "union":
+        result.extend(items2[j:])
+    return result
+
 """
 A class implementing an AVL tree.
 """
@@ -45,12 +289,118 @@ A class implementing an AVL tree.
 class AVLTree(object):
     """
     Constructor, you are allowed to add more fields.
+
+    @type combine: function
+    @param combine: an associative function of two values; when given, every node keeps the
+    combination of the values in its subtree (in key order) and aggregate answers range queries
+    @param identity: the identity element of combine, the aggregate of an empty range
+    @type index: bool
+    @param index: keep a dict from key to node beside the tree, so search takes O(1) for about
+    45 more bytes per key; join and split then cost O(size of the smaller tree) to move keys
+    @type duplicates: str
+    @param duplicates: None for a dictionary of distinct keys; 'count' for a multiset, where a
+    node counts the occurrences of its key and keeps the first value; 'bucket' for a multimap,
+    where node.value is the list of the values inserted with its key. Either way a key takes
+    one node however often it is inserted, and sizes, ranks and iteration count every occurrence.
+    Cannot be combined with combine or key, and set operations are not supported
+    @type key: function
+    @param key: as in sorted(), a function from the keys given to the tree (e.g. records) to the
+    keys compared. It is called once per key inserted, with node.key caching the result and
+    node.record holding the key as given; searches, bounds and ranks take keys as given and call
+    it once per call. Iteration and avl_to_array yield the keys as given. That one call per
+    operation makes it somewhat slower than comparing prebuilt keys (see key_func and tuple_key
+    in benchmark.py)
+    @raises ValueError: if duplicates is not one of these, or given together with combine or key
     """
-    def __init__(self):
+    # insert_many/delete_many rebuild the tree when the batch is at least size/ratio
+    _BATCH_REBUILD_RATIO = 16
+
+    # Methods enable_stats wraps on the instance, so a tree without stats runs the plain class methods
+    _STATS_OPERATIONS = ('search', 'finger_search', 'search_many', 'insert', 'finger_insert', 'delete',
+                         'insert_many', 'delete_many', 'join', 'split', 'union', 'intersection',
+                         'difference', 'rank', 'select', 'count_range', 'aggregate', 'avl_to_array')
+    _STATS_EVENTS = (('_rotate_left', 'rotations'), ('_rotate_right', 'rotations'), ('_update', 'height_updates'))
+
+    def __init__(self, combine=None, identity=None, index=False, duplicates=None, key=None):
+        if duplicates not in (None, 'count', 'bucket'):
+            raise ValueError("duplicates must be None, 'count' or 'bucket', got %r" % (duplicates,))
+        if duplicates is not None and combine is not None:
+            raise ValueError("aggregates are not supported together with duplicates")
+        if duplicates is not None and key is not None:
+            raise ValueError("a key function is not supported together with duplicates")
         self.root: AVLNode = None
         self._min = None
         self._max = None
         self._size = 0
+        self._combine = combine
+        self._identity = identity
+        self._finger = None # last node found or inserted, see last_accessed
+        self._index = {} if index else None # key -> node, for O(1) search
+        self._stats = None # see enable_stats
+        self._duplicates = duplicates
+        self._key_func = key # batch items of a keyed tree carry (record, value) as their value
+        if duplicates is not None:
+            self._node_class = _CountedNode
+        elif key is not None:
+            self._node_class = _KeyedAggregateNode if combine is not None else _KeyedNode
+        else:
+            self._node_class = _AggregateNode if combine is not None else AVLNode
+
+    def _empty_copy(self):
+        """Returns an empty tree with the same configuration as self."""
+        return AVLTree(self._combine, self._identity, self._index is not None, self._duplicates, self._key_func)
+
+    def _cmp_key(self, key):
+        """Returns the compared key of a key as given; None stays None, as an open bound."""
+        return key if key is None or self._key_func is None else self._key_func(key)
+
+    def _batch_items(self, items):
+        """Returns the (key, value) items of a batch as compared: in a keyed tree, the key is
+        computed once per item and the value becomes (record, value) - O(k)."""
+        if self._key_func is None:
+            return items
+        key_func = self._key_func
+        return [(key_func(record), (record, val)) for record, val in items]
+
+    def _reindex(self, nodes):
+        """Replaces the side index, if there is one, by an index of nodes - O(len(nodes))."""
+        if self._index is not None:
+            self._index = {node.key: node for node in nodes}
+
+    def _batch_node(self, key, val):
+        """Returns a new node for a batch item; with duplicates, val is the list of values of key."""
+        if self._key_func is not None:
+            node = self._node_class(key, val[1])
+            node.record = val[0]
+            return node
+        if self._duplicates is None:
+            return self._node_class(key, val)
+        node = self._node_class(key, val if self._duplicates == 'bucket' else val[0])
+        node.count = len(val)
+        return node
+
+    def _batch_update(self, node:AVLNode, val):
+        """Applies a batch item to the node already holding its key; the caller fixes the sizes."""
+        if self._key_func is not None:
+            node.record, node.value = val
+            return
+        if self._duplicates is None:
+            node.value = val
+            return
+        if self._duplicates == 'bucket':
+            node.value.extend(val)
+        node.count += len(val)
+
+    def _update(self, node:AVLNode):
+        """Recomputes the height, size and aggregate of node from its children."""
+        node.update()
+        if self._combine is not None:
+            self._update_aggregate(node)
+
+    def _update_aggregate(self, node:AVLNode):
+        combine = self._combine
+        agg = combine(node.left.agg, node.value) if node.left.is_real_node() else node.value
+        node.agg = combine(agg, node.right.agg) if node.right.is_real_node() else agg
 
     def _update_min_max(self, new_node=None):
 
@@ -73,20 +423,31 @@ class AVLTree(object):
         if node is None:
             return
         if node.left is None:
-            node.left = AVLNode(parent=node)
+            node.left = _VIRTUAL
         if node.right is None:
-            node.right = AVLNode(parent=node)
-        return  
+            node.right = _VIRTUAL
+        return
+
+    def _replace_child(self, parent, old, new):
+        """Puts new where old hung under parent (or at the root), never touching the sentinel."""
+        if parent is None:
+            self.root = new if new.is_real_node() else None
+        elif parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
+        if new.is_real_node():
+            new.parent = parent
    
     def _rotate_left(self, node:AVLNode):
-        if not node or not node.right: # Invalid node
+        if not node or not node.right.is_real_node(): # Invalid node
             return node
         
         # Rotate the tree to the left
         new_root = node.right 
         node.right = new_root.left
 
-        if new_root.left:
+        if new_root.left.is_real_node():
             new_root.left.parent = node 
 
         new_root.left = node
@@ -101,23 +462,23 @@ class AVLTree(object):
 
         node.parent = new_root
 
-        node.update_height()
-        new_root.update_height()
+        self._update(node)
+        self._update(new_root)
 
-        if self.root.key == node.key:
+        if self.root is node:
             self.root = new_root
 
         return new_root
     
     def _rotate_right(self, node:AVLNode):
-        if not node or not node.left:
+        if not node or not node.left.is_real_node():
             return node  
 
         # Rotate the tree to the right
         new_root = node.left
         node.left = new_root.right
         
-        if new_root.right:
+        if new_root.right.is_real_node():
             new_root.right.parent = node  
         
         new_root.right = node
@@ -132,39 +493,43 @@ class AVLTree(object):
         
         node.parent = new_root
 
-        node.update_height()
-        new_root.update_height()
+        self._update(node)
+        self._update(new_root)
 
-        if self.root.key == node.key:
+        if self.root is node:
             self.root = new_root
 
         return new_root
     
     def _find_min(self, start_node=None):
         node = start_node or self.root
-        while node.is_real_node(): # O(start_node.height) - O(log n) if starting from the root
+        while node.left.is_real_node(): # O(start_node.height) - O(log n) if starting from the root
             node = node.left
-        return node.parent
+        return node
     
     def _find_max(self, start_node=None):
         node = start_node or self.root
-        while node.is_real_node(): # O(start_node.height) - O(log n) if starting from the root
+        while node.right.is_real_node(): # O(start_node.height) - O(log n) if starting from the root
             node = node.right
-        return node.parent
+        return node
 
     def _search(self, key, root: AVLNode):
+        """Returns (node, parent, edges): node is the real node holding key or the virtual
+        node where it would hang, parent is the last real node on the path."""
         edges = 0
+        parent = None
         current_node = root
 
         while current_node.is_real_node(): # O(h) = O(log n)
             if current_node.key == key: # found
-                return current_node, edges + 1
-            elif current_node.key < key:  # go right
+                return current_node, current_node.parent, edges + 1
+            parent = current_node
+            if current_node.key < key:  # go right
                 current_node = current_node.right 
             else:
                 current_node = current_node.left
             edges += 1
-        return current_node, edges + 1
+        return current_node, parent, edges + 1
            
     def _successor(self, node:AVLNode):
         if node.right.height != -1:
@@ -176,12 +541,56 @@ class AVLTree(object):
             while node.parent is not None and node.parent.right == node: # O(log n)
                 node = node.parent
             return node.parent
+
+    def _predecessor(self, node:AVLNode):
+        if node.left.height != -1:
+            node = node.left
+            while node.right.height != -1: # O(node.height) = O(log n)
+                node = node.right
+            return node
+        else:
+            while node.parent is not None and node.parent.left == node: # O(log n)
+                node = node.parent
+            return node.parent
     
+    def _thread(self, node:AVLNode):
+        """Links node between its in-order neighbours, found through the tree structure - O(log n)."""
+        node.pred = self._predecessor(node)
+        node.succ = self._successor(node)
+        if node.pred is not None:
+            node.pred.succ = node
+        if node.succ is not None:
+            node.succ.pred = node
+
+    def _thread_list(self, nodes):
+        """Links a list of nodes sorted by key to each other, the ends get no neighbours - O(n)."""
+        previous = None
+        for node in nodes:
+            node.pred = previous
+            if previous is not None:
+                previous.succ = node
+            previous = node
+        if previous is not None:
+            previous.succ = None
+
+    def _unthread(self, node:AVLNode):
+        """Links the in-order neighbours of node to each other - O(1)."""
+        if node.pred is not None:
+            node.pred.succ = node.succ
+        if node.succ is not None:
+            node.succ.pred = node.pred
+        node.pred = node.succ = None
+
     def _insert(self, root: AVLNode, key, val):
         # Create new node
-        new_node = AVLNode(key, val)
+        new_node = self._node_class(key, val)
+        if self._index is not None:
+            self._index[key] = new_node
         self._add_virtual_nodes(new_node)
         new_node.height = 0
+        new_node.size = 1
+        if self._combine is not None:
+            new_node.agg = val
 
         # Tree is empty
         if root is None:
@@ -189,106 +598,126 @@ class AVLTree(object):
             return root, 0, 0
         
         # Find insertion point
-        current_node, edges = self._search(key, root) # O(log n)
-        current_node = current_node.parent # Go back to the last real node
+        _, current_node, edges = self._search(key, root) # O(log n), last real node on the path
         
         # Insert new node
         if current_node.key < key:
             current_node.right = new_node
+            new_node.pred, new_node.succ = current_node, current_node.succ
         else:
             current_node.left = new_node
+            new_node.pred, new_node.succ = current_node.pred, current_node
 
         new_node.parent = current_node
+        if new_node.pred is not None:
+            new_node.pred.succ = new_node
+        if new_node.succ is not None:
+            new_node.succ.pred = new_node
 
         # Rebalance
         promote = 0
-        current_node.update_height()
+        self._update(current_node)
         balance = current_node.get_balance()
         while abs(balance) < 2: # O(log n)
             promote += 1
             if current_node.parent is None:
                 break
             current_node = current_node.parent
-            current_node.update_height()
+            self._update(current_node)
             balance = current_node.get_balance()
 
-        self._rebalance(current_node) # O(1)
+        ancestor = self._rebalance(current_node).parent # O(1)
+        while ancestor is not None: # O(log n) - heights above are final, sizes still miss new_node
+            ancestor.size += 1
+            if self._combine is not None:
+                self._update_aggregate(ancestor)
+            ancestor = ancestor.parent
 
         return new_node, edges, promote
-    
-    def _delete_leaf(self, node:AVLNode):
-        """Deletes a leaf node from the AVL tree and replaces it with a virtual node."""
-        virtual_node = AVLNode(parent=node.parent)
-    
-        if node.parent is None: # Tree has only one node
-            self.root = None
-        elif node.key < node.parent.key: # Node is left child
-            node.parent.left = virtual_node
-            node.parent = None
-        else:
-            node.parent.right = virtual_node
-            node.parent = None
+
+    def _insert_duplicate(self, start:AVLNode, key, val):
+        """Inserts an occurrence of key in the subtree of start (None if self is empty) with a
+        single descent: an existing node takes it in place, otherwise a node is created where
+        the descent ended. Returns the (x,e,h) of insert - O(log n)."""
+        edges = 0
+        if start is not None:
+            node, parent, edges = self._search(key, start) # O(log n)
+            if node.is_real_node():
+                if self._duplicates == 'bucket':
+                    node.value.append(val)
+                node.count += 1
+                self._size += 1
+                self._finger = ancestor = node
+                while ancestor is not None: # O(log n), no shape change
+                    ancestor.size += 1
+                    ancestor = ancestor.parent
+                return node, edges, 0
+            start = parent # key hangs right below parent, so _insert does not descend again
+
+        new_node, _, promote = self._insert(start, key, [val] if self._duplicates == 'bucket' else val)
+        self._size += 1
+        if self.root is None:
+            self.root = self._min = self._max = new_node
+        self._update_min_max(new_node=new_node) # O(1)
+        self._finger = new_node
+        return new_node, edges, promote
 
     def _delete(self, node:AVLNode):
-        replacement = None
         rebalance_node = node.parent
 
         has_left = node.left.is_real_node()
         has_right = node.right.is_real_node()
         
-        if not (has_left or has_right): # node is a leaf
-            self._delete_leaf(node)
-        elif has_left and not has_right: # unary node (with left child)
-            if node.parent is None: # node is the root
-                self.root = node.left
-                node.left.parent = None
-            else:
-                node.parent.right = node.left
-                node.left.parent = node.parent
-        elif has_right and not has_left: # unary node (with right child)
-            if node.parent is None: # node is the root
-                self.root = node.right
-                node.right.parent = None
-            else:
-                node.parent.left = node.right
-                node.right.parent = node.parent
+        if not (has_left and has_right): # leaf or unary node - splice in its only child (or the virtual node)
+            self._replace_child(node.parent, node, node.left if has_left else node.right)
         else: # node has two children
-            replacement = self._successor(node)
-
-            if replacement.parent.key != node.key:
+            replacement = node.succ # O(1)
+
+            if replacement.parent is not node:
+                if replacement.count > 1: # the subtrees it leaves lose all its occurrences
+                    ancestor = replacement.parent
+                    while ancestor is not node: # O(log n), _retrace_delete takes off one more
+                        ancestor.size -= replacement.count - 1
+                        ancestor = ancestor.parent
                 # remove replacement from its current position
-                replacement.parent.left = replacement.right
-                replacement.right.parent = replacement.parent
-
-            # swap replacement with node
-            if node.parent: # node is somewhere in the tree (not the root)
-                if replacement.key < node.parent.key: # replacement should be left child
-                    node.parent.left = replacement
-                else:
-                    node.parent.right = replacement
-                replacement.parent = node.parent
                 rebalance_node = replacement.parent
-            else: # node is the root
-                if replacement.key < replacement.parent.key:
-                    replacement.parent.left = AVLNode(parent=replacement.parent)
-                else:
-                    replacement.parent.right = AVLNode(parent=replacement.parent)
-                replacement.parent = None
-                self.root = replacement
+                self._replace_child(replacement.parent, replacement, replacement.right)
+                replacement.right = node.right
+                node.right.parent = replacement
+            else:
                 rebalance_node = replacement
-        
-            # update children of replacement
+
+            # put replacement in node's place, taking over its pre-delete height and size
             replacement.left = node.left
             node.left.parent = replacement
-            replacement.right = node.right
-            node.right.parent = replacement
+            self._replace_child(node.parent, node, replacement)
+            replacement.height, replacement.size = node.height, node.size
+
+        node.parent = None
+        node.left = node.right = _VIRTUAL
+        self._unthread(node)
+        if self._index is not None:
+            del self._index[node.key]
 
-        
         # Rebalance
-        self._rebalance_tree(rebalance_node) # O(log n)
-        self.root = self._rebalance(self.root) # O(1)
-        if self.root:
-            self.root.parent = None
+        self._retrace_delete(rebalance_node) # O(log n)
+
+    def _retrace_delete(self, node:AVLNode):
+        """Updates and rebalances from node upwards after one key was removed below it.
+        Once a subtree keeps its height the ancestors only need their sizes (and aggregates) fixed."""
+        while node is not None: # O(log n)
+            height = node.height
+            self._update(node)
+            top = self._rebalance(node) # O(1)
+            node = top.parent
+            if top.height == height:
+                break
+
+        while node is not None: # O(log n) - heights above are final
+            node.size -= 1
+            if self._combine is not None:
+                self._update_aggregate(node)
+            node = node.parent
 
     def _rebalance(self, node:AVLNode):
         """Rebalances the AVL tree starting at node, returns the new root of the subtree."""
@@ -310,20 +739,476 @@ class AVLTree(object):
 
         return node
 
-    def _rebalance_tree(self, node:AVLNode):
-        """Rebalances the AVL tree starting at node, returns the new root."""
-        current_node = node
-        last_node = None
+    def _retrace(self, node:AVLNode):
+        """Updates and rebalances every node from node up to the top of its subtree, returns the top."""
+        top = node
+        while node is not None: # O(depth of node)
+            self._update(node)
+            top = self._rebalance(node) # O(1)
+            node = top.parent
+        return top
+
+    def _join_roots(self, left:AVLNode, node:AVLNode, right:AVLNode):
+        """Joins the parentless subtrees left < node < right (either may be virtual),
+        returns the new parentless root. O(|left.height - right.height| + 1)."""
+        if abs(left.height - right.height) <= 1:
+            node.left, node.right, node.parent = left, right, None
+            attach_parent = None
+        elif left.height > right.height: # hang node on the right spine of left
+            attach_parent, attach = left, left.right
+            while attach.height > right.height + 1:
+                attach_parent, attach = attach, attach.right
+            node.left, node.right = attach, right
+            attach_parent.right = node
+        else: # hang node on the left spine of right
+            attach_parent, attach = right, right.left
+            while attach.height > left.height + 1:
+                attach_parent, attach = attach, attach.left
+            node.left, node.right = left, attach
+            attach_parent.left = node
+
+        node.parent = attach_parent
+        if node.left.is_real_node():
+            node.left.parent = node
+        if node.right.is_real_node():
+            node.right.parent = node
+        self._update(node)
+        if attach_parent is None:
+            return node
+        return self._retrace(attach_parent)
+
+    def _join_roots_no_key(self, left:AVLNode, right:AVLNode):
+        """Joins the parentless subtrees left < right, using the maximum of left as the middle node."""
+        if not left.is_real_node():
+            return right
+        if not right.is_real_node():
+            return left
+        middle = self._find_max(left) # O(log n)
+        child = middle.left
+        if middle.parent is None:
+            left = child
+            if child.is_real_node():
+                child.parent = None
+        else:
+            middle.parent.right = child
+            if child.is_real_node():
+                child.parent = middle.parent
+            left = self._retrace(middle.parent) # O(log n)
+        return self._join_roots(left, middle, right)
 
-        while current_node is not None: # O(log n)
-            current_node.left = self._rebalance(current_node.left) # O(1)
-            current_node.right = self._rebalance(current_node.right) # O(1)
-            current_node.update_height()
-            last_node = current_node
-            current_node = current_node.parent
+    def _split_roots(self, root:AVLNode, key):
+        """Splits the parentless subtree root around key in O(log n).
+
+        @returns: a tuple (left, node, right) of the parentless subtrees holding the smaller
+        and larger keys, and the detached node holding key (None if key is missing).
+        """
+        path = []
+        node = root
+        while node.is_real_node() and node.key != key: # O(log n)
+            path.append(node)
+            node = node.right if node.key < key else node.left
+
+        found = node if node.is_real_node() else None
+        left, right = node.left, node.right
+        if found:
+            found.left = found.right = _VIRTUAL
+            found.parent = None
+        if left is not None and left.is_real_node():
+            left.parent = None
+        else:
+            left = _VIRTUAL
+        if right is not None and right.is_real_node():
+            right.parent = None
+        else:
+            right = _VIRTUAL
+
+        # Every ancestor goes to one side together with its subtree on that side
+        for ancestor in reversed(path): # O(log n) in total, each join is O(height difference)
+            if ancestor.key < key:
+                subtree = ancestor.left
+                if subtree.is_real_node():
+                    subtree.parent = None
+                left = self._join_roots(subtree, ancestor, left)
+            else:
+                subtree = ancestor.right
+                if subtree.is_real_node():
+                    subtree.parent = None
+                right = self._join_roots(right, ancestor, subtree)
+        return left, found, right
+
+    def _link_balanced(self, nodes):
+        """Links a list of nodes sorted by key into a perfectly balanced subtree, returns its root."""
+        n = len(nodes)
+        if n == 0:
+            return _VIRTUAL
+
+        # Each entry is a slice [lo, hi) of nodes whose middle becomes a child of parent
+        root = None
+        linked = [] if self._combine is not None else None
+        # With duplicates a slice holds the occurrences of its nodes, prefix[hi] - prefix[lo]
+        prefix = list(accumulate((node.count for node in nodes), initial=0)) if self._duplicates is not None else None
+        stack = [(0, n, None, False)]
+        while stack: # O(n)
+            lo, hi, parent, is_left = stack.pop()
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            if linked is not None:
+                linked.append(node)
+            node.parent = parent
+            node.left = node.right = _VIRTUAL
+            # Halves differ in size by at most 1, so a slice of m nodes has height floor(log2(m))
+            node.height = (hi - lo).bit_length() - 1
+            node.size = hi - lo if prefix is None else prefix[hi] - prefix[lo]
+
+            if parent is None:
+                root = node
+            elif is_left:
+                parent.left = node
+            else:
+                parent.right = node
+
+            if lo < mid:
+                stack.append((lo, mid, node, True))
+            if mid + 1 < hi:
+                stack.append((mid + 1, hi, node, False))
+
+        self._thread_list(nodes) # O(n)
+
+        if linked is not None: # children were linked after their parents
+            for node in reversed(linked): # O(n)
+                self._update_aggregate(node)
+        return root
+
+    def _iter_nodes(self, reverse=False):
+        """Yields the real nodes in key order (descending if reverse) in O(1) memory,
+        following the threaded in-order links - O(1) per node."""
+        node = self._max if reverse else self._min
+        while node is not None: # O(n)
+            yield node
+            node = node.pred if reverse else node.succ
+
+    def _ceiling_node(self, key, inclusive=True):
+        """Returns the first node with a key above key (or equal, if inclusive), None if there is none."""
+        node = self.root if self.root is not None else _VIRTUAL
+        best = None
+        while node.is_real_node(): # O(log n), the walk of _search
+            if node.key > key or (inclusive and node.key == key):
+                best = node
+                node = node.left
+            else:
+                node = node.right
+        return best
+
+    def _floor_node(self, key, inclusive=True):
+        """Returns the last node with a key below key (or equal, if inclusive), None if there is none."""
+        node = self.root if self.root is not None else _VIRTUAL
+        best = None
+        while node.is_real_node(): # O(log n), the walk of _search
+            if node.key < key or (inclusive and node.key == key):
+                best = node
+                node = node.right
+            else:
+                node = node.left
+        return best
+
+    def _iter_range(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        """Yields the nodes with keys between lo and hi (None is unbounded) in O(log n + k)."""
+        lo_inclusive, hi_inclusive = inclusive
+        if reverse:
+            node = self._max if hi is None else self._floor_node(hi, hi_inclusive) # O(log n)
+            bound, bound_inclusive, beyond = lo, lo_inclusive, -1
+        else:
+            node = self._min if lo is None else self._ceiling_node(lo, lo_inclusive) # O(log n)
+            bound, bound_inclusive, beyond = hi, hi_inclusive, 1
+
+        count = 0
+        while node is not None and (limit is None or count < limit): # O(k)
+            if bound is not None:
+                if node.key == bound:
+                    if not bound_inclusive:
+                        return
+                elif (node.key > bound) == (beyond == 1):
+                    return
+            yield node
+            count += 1
+            node = node.pred if reverse else node.succ # O(1)
+
+    def _iter_occurrences(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        """Yields a (key, value) pair per occurrence of the keys in the range, for trees with
+        duplicates; limit counts occurrences - O(log n + k)."""
+        count = 0
+        for node in self._iter_range(lo, hi, inclusive, reverse):
+            if self._duplicates == 'bucket':
+                values = reversed(node.value) if reverse else node.value
+            else:
+                values = repeat(node.value, node.count)
+            for val in values:
+                if limit is not None and count >= limit:
+                    return
+                yield node.key, val
+                count += 1
+
+    def _insert_sorted(self, root:AVLNode, batch, lo, hi, created):
+        """Merges batch[lo:hi] into the parentless subtree root by splitting at the middle item,
+        returns the new root and appends the new nodes (not threaded yet) to created.
+        O(k log(n/k + 1)) for k items."""
+        if lo == hi:
+            return root
+        if not root.is_real_node():
+            nodes = [self._batch_node(key, val) for key, val in batch[lo:hi]]
+            created.extend(nodes)
+            return self._link_balanced(nodes)
+        mid = (lo + hi) // 2
+        key, val = batch[mid]
+        left, node, right = self._split_roots(root, key) # O(log n)
+        if node is None:
+            node = self._batch_node(key, val)
+            created.append(node)
+        else:
+            self._batch_update(node, val) # node is detached, the join below recomputes its size
+        left = self._insert_sorted(left, batch, lo, mid, created)
+        right = self._insert_sorted(right, batch, mid + 1, hi, created)
+        return self._join_roots(left, node, right)
+
+    def _subtree_nodes(self, root:AVLNode):
+        """Returns the real nodes of the subtree root in key order, walking the structure - O(size)."""
+        nodes, stack, node = [], [], root
+        while stack or node.is_real_node():
+            if node.is_real_node():
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                nodes.append(node)
+                node = node.right
+        return nodes
+
+    def _detach_children(self, node:AVLNode):
+        """Cuts node off from its children, returns them as parentless subtrees."""
+        left, right = node.left, node.right
+        node.left = node.right = _VIRTUAL
+        if left.is_real_node():
+            left.parent = None
+        if right.is_real_node():
+            right.parent = None
+        return left, right
+
+    def _union_roots(self, big:AVLNode, small:AVLNode, merge, created):
+        """Unions the parentless subtrees big and small by splitting big at the root of small.
+        merge(big value, small value) resolves keys present in both, whose big node is kept;
+        the other nodes of small are appended to created (not threaded yet). O(m log(n/m + 1))."""
+        if not small.is_real_node():
+            return big
+        if not big.is_real_node():
+            created.extend(self._subtree_nodes(small))
+            return small
+        node = small
+        small_left, small_right = self._detach_children(node)
+        left, found, right = self._split_roots(big, node.key) # O(log n)
+        left = self._union_roots(left, small_left, merge, created)
+        right = self._union_roots(right, small_right, merge, created)
+        if found is not None:
+            found.value = merge(found.value, node.value)
+            node = found
+        else:
+            created.append(node)
+        return self._join_roots(left, node, right)
+
+    def _intersection_roots(self, big:AVLNode, small:AVLNode, merge):
+        """Intersects the parentless subtrees big and small by splitting big at the root of small,
+        keeping the nodes of big with merge(big value, small value). Threads are left stale."""
+        if not big.is_real_node() or not small.is_real_node():
+            return _VIRTUAL
+        small_left, small_right = self._detach_children(small)
+        left, found, right = self._split_roots(big, small.key) # O(log n)
+        left = self._intersection_roots(left, small_left, merge)
+        right = self._intersection_roots(right, small_right, merge)
+        if found is None:
+            return self._join_roots_no_key(left, right)
+        found.value = merge(found.value, small.value)
+        return self._join_roots(left, found, right)
+
+    def _difference_roots(self, root:AVLNode, other:AVLNode):
+        """Removes the keys of the parentless subtree other from the parentless subtree root
+        by splitting root at the root of other, unthreading the removed nodes."""
+        if not root.is_real_node() or not other.is_real_node():
+            return root
+        other_left, other_right = self._detach_children(other)
+        left, found, right = self._split_roots(root, other.key) # O(log n)
+        if found is not None:
+            self._unthread(found)
+            if self._index is not None:
+                del self._index[found.key]
+        left = self._difference_roots(left, other_left)
+        right = self._difference_roots(right, other_right)
+        return self._join_roots_no_key(left, right)
+
+    def _set_algebra_parallel(self, tree2, operation, merge, workers):
+        """Runs a set operation as linear merges of key ranges on a process pool,
+        then rebuilds self from the result. O(n + m) work split between the workers."""
+        if self._key_func is not None: # merge on the compared keys, carrying the records along
+            items1 = [(node.key, (node.record, node.value)) for node in self._iter_nodes()] # O(n + m)
+            items2 = [(node.key, (node.record, node.value)) for node in tree2._iter_nodes()]
+            merge = partial(_merge_records, merge)
+        else:
+            items1, items2 = list(self.items()), list(tree2.items()) # O(n + m), not counted as avl_to_array
+        keys1 = [key for key, _ in items1]
+        keys2 = [key for key, _ in items2]
+        larger = keys1 if len(keys1) >= len(keys2) else keys2
+        pivots = [larger[len(larger) * i // workers] for i in range(1, workers)] if larger else []
+        bounds1 = [0] + [bisect_left(keys1, pivot) for pivot in pivots] + [len(keys1)]
+        bounds2 = [0] + [bisect_left(keys2, pivot) for pivot in pivots] + [len(keys2)]
+        chunks1 = [items1[lo:hi] for lo, hi in zip(bounds1, bounds1[1:])]
+        chunks2 = [items2[lo:hi] for lo, hi in zip(bounds2, bounds2[1:])]
+
+        with ProcessPoolExecutor(workers) as pool:
+            merged = pool.map(_merge_items, repeat(operation), chunks1, chunks2, repeat(merge))
+            nodes = [self._batch_node(key, val) for chunk in merged for key, val in chunk]
+
+        root = self._link_balanced(nodes) # O(n + m)
+        if nodes:
+            self._set_root(root, len(nodes), nodes[0], nodes[-1])
+        else:
+            self._set_root(_VIRTUAL, 0)
+        self._reindex(nodes)
+        tree2._set_root(_VIRTUAL, 0)
+        tree2._reindex(())
+
+    def _check_set_algebra(self, operation):
+        if self._duplicates is not None:
+            raise ValueError("%s is not supported in trees with duplicates" % operation)
+
+    def _delete_sorted(self, root:AVLNode, keys, lo, hi):
+        """Removes keys[lo:hi] from the parentless subtree root by splitting at the middle key,
+        returns (new root, number of removed items). O(k log(n/k + 1)) for k keys."""
+        if lo == hi or not root.is_real_node():
+            return root, 0
+        mid = (lo + hi) // 2
+        left, node, right = self._split_roots(root, keys[mid]) # O(log n)
+        if node is not None:
+            self._unthread(node)
+            if self._index is not None:
+                del self._index[node.key]
+        left, left_removed = self._delete_sorted(left, keys, lo, mid)
+        right, right_removed = self._delete_sorted(right, keys, mid + 1, hi)
+        removed = node.count if node is not None else 0
+        return self._join_roots_no_key(left, right), removed + left_removed + right_removed
+
+    def _set_root(self, root:AVLNode, size, minimum=None, maximum=None):
+        """Installs a parentless subtree (possibly virtual) as the whole tree.
+        The extremes are looked up in O(log n) unless the caller already knows them."""
+        self._finger = None # may have been deleted or moved to another tree
+        if root.is_real_node():
+            root.parent = None
+            self.root = root
+        else:
+            self.root = None
+        self._size = size
+        if minimum is None or maximum is None or self.root is None:
+            self._update_min_max() # O(log n)
+        else:
+            self._min, self._max = minimum, maximum
+
+    """builds a perfectly balanced tree from sorted items in O(n), without recursion
+
+    @type items: iterable
+    @pre: items yields (key, value) pairs with strictly increasing keys (non-decreasing, with duplicates),
+    compared with the key function if options gives one
+    @param items: the items of the new dictionary
+    @param options: constructor arguments of the new tree
+    @rtype: AVLTree
+    @returns: a new tree holding items
+    """
+    @classmethod
+    def from_sorted(cls, items, **options):
+        tree = cls(**options)
+        if tree._key_func is not None:
+            nodes = [tree._batch_node(key, val) for key, val in tree._batch_items(items)]
+        elif tree._duplicates is None:
+            nodes = [tree._node_class(key, val) for key, val in items]
+        else:
+            nodes = [tree._batch_node(key, values) for key, values in _group_values(items)]
+        root = tree._link_balanced(nodes) # O(n)
+        if nodes:
+            tree._set_root(root, root.size, nodes[0], nodes[-1])
+        tree._reindex(nodes)
+        return tree
+
+    """writes the dictionary to a file in a compact binary format, in O(n)
+
+    The keys and the values are stored as two columns in key order; int and str columns are
+    packed, other types are pickled as one list. The tree structure is not stored. A tree with
+    duplicates stores every occurrence, and a tree with a key function the keys as given, to be
+    loaded with the same option.
+
+    @type path: str
+    @param path: the file to create or overwrite
+    """
+    def save(self, path):
+        keys, values = [], []
+        for key, val in (self._iter_occurrences() if self._duplicates is not None else
+                         self.items() if self._key_func is not None else
+                         ((node.key, node.value) for node in self._iter_nodes())): # O(n)
+            keys.append(key)
+            values.append(val)
+        key_encoding, key_data = _encode_column(keys)
+        value_encoding, value_data = _encode_column(values)
+        with open(path, 'wb') as file:
+            file.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, key_encoding, value_encoding, len(keys)))
+            file.write(_FILE_DUPLICATES.pack(_DUPLICATE_MODES.index(self._duplicates)))
+            for data in (key_data, value_data):
+                file.write(_COLUMN_LENGTH.pack(len(data)))
+                file.write(data)
+
+    """reads a dictionary written by save, building the balanced tree in O(n)
+
+    @type path: str
+    @param path: a file written by save
+    @param options: constructor arguments of the new tree, e.g. combine and identity;
+    duplicates must be the option of the saved tree
+    @rtype: AVLTree
+    @returns: a new tree holding the saved items
+    @raises ValueError: if the file was not written by save, is truncated or was saved with
+    another duplicates option
+    """
+    @classmethod
+    def load(cls, path, **options):
+        with open(path, 'rb') as file:
+            header = file.read(_FILE_HEADER.size)
+            if len(header) != _FILE_HEADER.size:
+                raise ValueError("%s is not an AVLTree file" % path)
+            magic, version, key_encoding, value_encoding, count = _FILE_HEADER.unpack(header)
+            if magic != _FILE_MAGIC:
+                raise ValueError("%s is not an AVLTree file" % path)
+            if version not in (1, _FILE_VERSION):
+                raise ValueError("unsupported AVLTree file version %d" % version)
+            duplicates = None # version 1 files were all saved from trees without duplicates
+            if version >= 2:
+                mode = file.read(_FILE_DUPLICATES.size)
+                if len(mode) != _FILE_DUPLICATES.size:
+                    raise ValueError("%s is truncated" % path)
+                mode, = _FILE_DUPLICATES.unpack(mode)
+                if mode >= len(_DUPLICATE_MODES):
+                    raise ValueError("%s has an unknown duplicates mode %d" % (path, mode))
+                duplicates = _DUPLICATE_MODES[mode]
+            if duplicates != options.get('duplicates'):
+                raise ValueError("%s was saved with duplicates=%r, loading it needs the same option"
+                                 % (path, duplicates))
+            columns = []
+            for encoding in (key_encoding, value_encoding):
+                length = file.read(_COLUMN_LENGTH.size)
+                if len(length) != _COLUMN_LENGTH.size:
+                    raise ValueError("%s is truncated" % path)
+                length, = _COLUMN_LENGTH.unpack(length)
+                data = file.read(length)
+                if len(data) != length:
+                    raise ValueError("%s is truncated" % path)
+                column = _decode_column(encoding, data, count)
+                if len(column) != count:
+                    raise ValueError("%s has a column of %d items, expected %d" % (path, len(column), count))
+                columns.append(column)
+        return cls.from_sorted(zip(*columns), **options) # O(n)
 
-        return last_node
-    
     """searches for a node in the dictionary corresponding to the key (starting at the root)
         
     @type key: int
@@ -331,46 +1216,149 @@ class AVLTree(object):
     @rtype: (AVLNode,int)
     @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
     and e is the number of edges on the path between the starting node and ending node+1.
+    In a tree with an index no path is walked, and e is 1 whether or not key is found
+    (-1 for an empty tree, as without an index).
     """
     def search(self, key):
         if self.root is None: # Empty tree
             return None, -1
-        node, edges = self._search(key, self.root) # O(log n)
+        if self._key_func is not None:
+            key = self._key_func(key) # once, not at every node of the descent
+        if self._index is not None:
+            node = self._index.get(key) # O(1)
+            if node is not None:
+                self._finger = node
+            return node, 1
+        node, _, edges = self._search(key, self.root) # O(log n)
         if node.is_real_node():
+            self._finger = node
             return node, edges
         return None, edges # Node not found
 
-    """searches for a node in the dictionary corresponding to the key, starting at the max
-        
+    def _climb(self, start:AVLNode, key):
+        """Climbs from start to the lowest ancestor whose subtree spans the position of key.
+
+        The subtree of a node is an interval of the keys, bounded by the parent on the side it
+        hangs from, so the climb stops at the first parent beyond key. O(log d) for d keys
+        between start and key.
+        @returns: a tuple (node, e) of that ancestor and the number of edges climbed
+        """
+        if key > self._max.key: # beyond the extremes the position hangs right below _max/_min,
+            return self._max, 0 # whose open side has no parent bound to stop a climb
+        if key < self._min.key:
+            return self._min, 0
+        node = start
+        edges = 0
+        while node.key != key and node.parent is not None: # O(log d)
+            parent = node.parent
+            if node is parent.left:
+                if node.key < key < parent.key:
+                    break
+            elif parent.key < key < node.key:
+                break
+            node = parent
+            edges += 1
+        return node, edges
+
+    """searches for a node in the dictionary corresponding to the key, starting at a finger
+
     @type key: int
     @param key: a key to be searched
+    @type start: AVLNode
+    @param start: the node to start from, e.g. last_accessed(); None starts at the max
     @rtype: (AVLNode,int)
     @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
-    and e is the number of edges on the path between the starting node and ending node+1.
+    and e is the number of edges climbed from the starting node and walked down to the ending node+1.
     """
-    def finger_search(self, key):
-        current_node = self._max
-        edge = 0
-        # Traverse up the tree starting at max
-        while current_node is not None: # O(log k)
-            if current_node.key == key: # Found
-                return current_node, edge + 1
-            elif current_node.key < key or current_node.key == self.root.key: 
-                found_node, path =  self._search(root=current_node, key=key) # Search the subtree - O(logk)
-                if found_node is not None:
-                    return found_node, path + edge
-                break # Total time complexity: O(logk)
-            elif current_node.key > key: # Move up
-                current_node = current_node.parent 
-            edge += 1
-    
+    def finger_search(self, key, start=None):
+        if self.root is None: # Empty tree
+            return None, -1
+        if self._key_func is not None:
+            key = self._key_func(key)
+        node, climb_edges = self._climb(start or self._max, key) # O(log d)
+        found_node, _, path = self._search(key, node) # Search the subtree - O(log d)
+        if found_node.is_real_node():
+            self._finger = found_node
+            return found_node, climb_edges + path
+        return None, climb_edges + path # Node not found
+
+    """searches for a batch of keys, sorting them and moving a finger from one key to the next
+
+    Each key is found by climbing from the position of the previous (smaller) key only as far
+    as needed, so k sorted keys cost O(k log(n/k + 1)) instead of k root descents.
+
+    @type keys: list or numpy.ndarray
+    @param keys: the keys to search, in any order, repeats allowed
+    @type edges: bool
+    @param edges: whether to also return the number of edges walked for each key
+    @rtype: (list,list) or (list,list,list)
+    @returns: (found, values) or (found, values, edges), aligned with keys: whether each key is
+    in the dictionary, its value (None if not), and the edges climbed from the previous position
+    and walked down to the ending node+1, as in finger_search.
+    Given a numpy array, the results are numpy arrays of bool, object and int64.
+    """
+    def search_many(self, keys, edges=False):
+        as_numpy = numpy is not None and isinstance(keys, numpy.ndarray)
+        keys = keys.tolist() if as_numpy else list(keys)
+        if self._key_func is not None:
+            keys = list(map(self._key_func, keys)) # O(k), each key once
+        k = len(keys)
+        found = [False] * k
+        values = [None] * k
+        edge_counts = [-1 if self.root is None else 1] * k
+
+        if self._index is not None: # O(1) per key
+            index = self._index
+            for i, key in enumerate(keys):
+                node = index.get(key)
+                if node is not None:
+                    found[i] = True
+                    values[i] = node.value
+        elif self.root is not None:
+            finger = self._min
+            previous = None
+            for i in sorted(range(k), key=keys.__getitem__): # O(k log k)
+                key = keys[i]
+                if previous is not None and keys[previous] == key: # a repeated key
+                    found[i], values[i] = found[previous], values[previous]
+                    edge_counts[i] = 1
+                    continue
+                start, climbed = self._climb(finger, key) # O(log d)
+                node, parent, walked = self._search(key, start) # O(log d)
+                if node.is_real_node():
+                    found[i] = True
+                    values[i] = node.value
+                    finger = self._finger = node
+                else:
+                    finger = parent
+                edge_counts[i] = climbed + walked
+                previous = i
+
+        if as_numpy:
+            found = numpy.array(found, dtype=bool)
+            value_array = numpy.empty(k, dtype=object)
+            for i, value in enumerate(values): # element-wise, so sequence values stay whole
+                value_array[i] = value
+            values = value_array
+            edge_counts = numpy.array(edge_counts, dtype=numpy.int64)
+        return (found, values, edge_counts) if edges else (found, values)
+
+    """returns the node most recently found or inserted by search, finger_search, insert or
+    finger_insert, to be passed as the start of the next finger operation
 
-        return None, -1 # Node not found
+    @rtype: AVLNode
+    @returns: the node, None if there is none or it has left the dictionary
+    """
+    def last_accessed(self):
+        return self._finger
     
     """inserts a new node into the dictionary with corresponding key and value (starting at the root)
 
+    In a tree with duplicates, inserting a key that is already present adds an occurrence to
+    its node instead, in the same single descent; x is then that node and h is 0.
+
     @type key: int
-    @pre: key currently does not appear in the dictionary
+    @pre: key currently does not appear in the dictionary, unless self has duplicates
     @param key: key of item that is to be inserted to self
     @type val: string
     @param val: the value of the item
@@ -380,59 +1368,178 @@ class AVLTree(object):
     and h is the number of PROMOTE cases during the AVL rebalancing
     """
     def insert(self, key, val):
+        if self._duplicates is not None:
+            return self._insert_duplicate(self.root, key, val) # O(log n)
+        record = key
+        if self._key_func is not None:
+            key = self._key_func(key) # cached on the new node
         self._size += 1
         new_node, edges, promote = self._insert(self.root, key, val) # O(log n)
+        if self._key_func is not None:
+            new_node.record = record
         if self.root is None:
             self.root = new_node
             self._min = new_node
             self._max = new_node
 
         self._update_min_max(new_node=new_node) # O(1)
+        self._finger = new_node
         return new_node, edges, promote
 
-    """inserts a new node into the dictionary with corresponding key and value, starting at the max
+    """inserts a new node into the dictionary with corresponding key and value, starting at a finger
+    (adding an occurrence, as insert does, in a tree with duplicates)
     @type key: int
-    @pre: key currently does not appear in the dictionary
+    @pre: key currently does not appear in the dictionary, unless self has duplicates
     @param key: key of item that is to be inserted to self
     @type val: string
     @param val: the value of the item
+    @type start: AVLNode
+    @param start: the node to start from, e.g. last_accessed(); None starts at the max
     @rtype: (AVLNode,int,int)
     @returns: a 3-tuple (x,e,h) where x is the new node,
     e is the number of edges on the path between the starting node and new node before rebalancing,
     and h is the number of PROMOTE cases during the AVL rebalancing
     """
-    def finger_insert(self, key, val):
+    def finger_insert(self, key, val, start=None):
         if self._max is None:
-            return self.insert(key, val) # Empty tree - O(1)
+            return AVLTree.insert(self, key, val) # Empty tree - O(1), counted as finger_insert only
+        elif self._duplicates is not None:
+            current_node, search_edges = self._climb(start or self._max, key) # O(log d)
+            node, insert_edges, promote = self._insert_duplicate(current_node, key, val) # O(log d)
+            return node, search_edges + insert_edges, promote
         else:
+            record = key
+            if self._key_func is not None:
+                key = self._key_func(key)
             self._size += 1
-            current_node = self._max
-
-            search_edges = 0
-            while current_node.parent is not None: # O(log k)
-                if current_node.key > key:
-                    current_node = current_node.parent
-                elif current_node.key < key: 
-                    break
-                search_edges += 1
-            
-            new_node, insert_edges, promote = self._insert(root=current_node, key=key, val=val) # O(log k)
+            current_node, search_edges = self._climb(start or self._max, key) # O(log d)
+            new_node, insert_edges, promote = self._insert(root=current_node, key=key, val=val) # O(log d)
+            if self._key_func is not None:
+                new_node.record = record
             self._update_min_max(new_node=new_node) # O(1)
+            self._finger = new_node
 
             return new_node, search_edges + insert_edges, promote
 
     """deletes node from the dictionary
 
+    In a tree with duplicates this removes one occurrence of node.key (the last value of its
+    bucket), and node leaves the tree with its last occurrence.
+
     @type node: AVLNode
     @pre: node is a real pointer to a node in self
     """
     def delete(self, node):
+        if node.count > 1: # only in trees with duplicates
+            if self._duplicates == 'bucket':
+                node.value.pop()
+            node.count -= 1
+            self._size -= 1
+            while node is not None: # O(log n), no shape change
+                node.size -= 1
+                node = node.parent
+            return
+        if node is self._finger:
+            self._finger = None
+        if node is self._min:
+            self._min = node.succ # O(1)
+        if node is self._max:
+            self._max = node.pred # O(1)
         self._size -= 1
         self._delete(node) # O(log n)
-        self._update_min_max() # O(log n)
 
     
-    """joins self with item and another AVLTree
+    """inserts a batch of items, replacing the value of keys already in the dictionary
+
+    A batch that is small relative to the dictionary is merged in with split/join; a large one
+    is merged with the sorted dictionary and rebuilt into a balanced tree. In a tree with
+    duplicates every item is added as an occurrence, as by insert.
+
+    @type items: iterable
+    @param items: (key, value) pairs, in any order; for repeated keys the last value wins
+    @rtype: int
+    @returns: the number of keys that were not in the dictionary before
+    (with duplicates, the number of items added)
+    """
+    def insert_many(self, items):
+        items = self._batch_items(items)
+        if self._duplicates is not None:
+            batch = _group_values(sorted(items, key=itemgetter(0))) # O(k log k), stable
+        else:
+            batch = []
+            for key, val in sorted(items, key=itemgetter(0)): # O(k log k), stable
+                if batch and batch[-1][0] == key:
+                    batch[-1] = (key, val)
+                else:
+                    batch.append((key, val))
+        if not batch:
+            return 0
+
+        if len(batch) * self._BATCH_REBUILD_RATIO < self._size:
+            created = []
+            root = self._insert_sorted(self.root, batch, 0, len(batch), created) # O(k log(n/k + 1))
+            root.parent = None
+            for node in created: # O(k log n)
+                self._thread(node)
+                if self._index is not None:
+                    self._index[node.key] = node
+            added = len(created)
+        else: # merge with the dictionary and rebuild - O(n + k)
+            nodes = []
+            added = 0
+            batch_items = iter(batch)
+            pending = next(batch_items, None)
+            for node in self._iter_nodes():
+                while pending is not None and pending[0] < node.key:
+                    nodes.append(self._batch_node(*pending))
+                    added += 1
+                    pending = next(batch_items, None)
+                if pending is not None and pending[0] == node.key:
+                    self._batch_update(node, pending[1])
+                    pending = next(batch_items, None)
+                nodes.append(node)
+            while pending is not None:
+                nodes.append(self._batch_node(*pending))
+                added += 1
+                pending = next(batch_items, None)
+            root = self._link_balanced(nodes)
+            self._reindex(nodes)
+
+        if self._duplicates is not None: # every item is a new occurrence
+            added = sum(len(values) for _, values in batch)
+
+        self._set_root(root, self._size + added)
+        return added
+
+    """deletes a batch of keys from the dictionary, ignoring keys that are not in it
+
+    In a tree with duplicates every occurrence of the keys is deleted.
+
+    @type keys: iterable
+    @param keys: the keys to delete, in any order
+    @rtype: int
+    @returns: the number of keys that were deleted (with duplicates, of occurrences)
+    """
+    def delete_many(self, keys):
+        if self._key_func is not None:
+            keys = map(self._key_func, keys)
+        batch = sorted(set(keys)) # O(k log k)
+        if not batch or self.root is None:
+            return 0
+
+        if len(batch) * self._BATCH_REBUILD_RATIO < self._size:
+            root, removed = self._delete_sorted(self.root, batch, 0, len(batch)) # O(k log(n/k + 1))
+        else: # filter the dictionary and rebuild - O(n + k)
+            doomed = set(batch)
+            nodes = [node for node in self._iter_nodes() if node.key not in doomed]
+            removed = self._size - (len(nodes) if self._duplicates is None else sum(node.count for node in nodes))
+            root = self._link_balanced(nodes)
+            self._reindex(nodes)
+
+        self._set_root(root, self._size - removed)
+        return removed
+
+    """joins self with item and another AVLTree, in O(|height difference| + 1), leaving tree2 empty
 
     @type tree2: AVLTree 
     @param tree2: a dictionary to be joined with self
@@ -442,83 +1549,48 @@ class AVLTree(object):
     @param val: the value corresponding to key
     @pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
     or the opposite way
+    @post: the nodes of tree2 belong to self and tree2 is empty.
+    self keeps its own configuration: if it has an index and tree2 has none, the keys of tree2
+    are indexed in O(m) for m keys in tree2
     """
     def join(self, tree2, key, val):
-        new_node = AVLNode(key, val)
-
-        # Update the size of the resulting tree if both trees are non-empty
-        if self._size and tree2.size():
-            self._size += 1 + tree2.size()
-
-        # Case 1: Both trees are empty
-        if self.root is None and (tree2 is None or tree2.root is None):
-            # Insert the new node as the root since both trees are empty
-            self.root, _, _  = self.insert(key, val) # O(1)
-            return
-        
-        # case 2: one tree is empty 
-        if self.root is None or (tree2 is None or tree2.root is None):
-            non_empty_tree = self if self.root else tree2
-            self.root = non_empty_tree.root
-            self._size = non_empty_tree.size()
-            self._update_min_max() # O(log n)
-            self.insert(key, val) # O(log n)
-            return
-
-        # Case 3: Both trees are non-empty
-        # Ensure self is the lower tree 
-        if self.root.height > tree2.root.height:
-            self, tree2 = tree2, self
-
-        b_parent = None
-        b = tree2.root
-        target_height = self.root.height # Target height to attach `self` to `tree2`
-
-        # Attach `self` to the left or right of the new node based on the key comparison
-        if self.root.key < key:
-            while b.height > target_height:
-                b_parent = b
-                b = b.left
-            # Attach `self` as the left child of the new node
-            new_node.left = self.root
-            self.root.parent = new_node
-            # Attach the subtree from `tree2` as the right child of the new node
-            new_node.right = b
-
-        elif self.root.key > key:
-            # Traverse `tree2` to find the appropriate position based on height
-            while b.height > target_height:
-                b_parent = b
-                b = b.right
-            # Attach `self` as the right child of the new node
-            self.root.parent = new_node
-            new_node.right = self.root
-            new_node.left = b
-
-        # Update the parent's reference to point to the new node
-        if b_parent:
-            if b_parent.left == b:
-                b_parent.left = new_node
-            else:
-                b_parent.right = new_node
-            b_parent.update_height()
-      
-        # Update parent pointers and heights for the new node
-        new_node.parent = b_parent
-        b.parent = new_node
-        if new_node:
-            new_node.update_height()
-        if new_node.parent:
-            new_node.parent.update_height()
-        tree1 = AVLTree()
-        tree1.root = new_node
-
-        # Rebalance the tree starting from the new node
-        self.root = self._rebalance_tree(new_node)  # O(log n)
-        self._update_min_max() # O(log n)
+        record = key
+        if self._key_func is not None:
+            key = self._key_func(key)
+        new_node = self._node_class(key, [val] if self._duplicates == 'bucket' else val)
+        if self._key_func is not None:
+            new_node.record = record
+        self_root = self.root if self.root is not None else _VIRTUAL
+        other_root = tree2.root if tree2.root is not None else _VIRTUAL
+        other_index = tree2._index
+        if self._index is not None and other_index is None: # index the keys of tree2 before they mix - O(m)
+            other_index = {node.key: node for node in self._subtree_nodes(other_root)}
+
+        if (self.root is not None and self.root.key < key) or \
+                (tree2.root is not None and tree2.root.key > key): # self holds the smaller keys
+            smaller, larger = self, tree2
+            root = self._join_roots(self_root, new_node, other_root) # O(log n)
+        else:
+            smaller, larger = tree2, self
+            root = self._join_roots(other_root, new_node, self_root) # O(log n)
+
+        new_node.pred, new_node.succ = smaller._max, larger._min
+        if new_node.pred is not None:
+            new_node.pred.succ = new_node
+        if new_node.succ is not None:
+            new_node.succ.pred = new_node
+        if self._index is not None: # the larger index absorbs the smaller one - O(min(n, m))
+            index, other = (self._index, other_index) if self._size >= tree2.size() else (other_index, self._index)
+            index.update(other)
+            index[key] = new_node
+            self._index = index
+        self._set_root(root, self._size + 1 + tree2.size(), # O(1)
+                       smaller._min or new_node, larger._max or new_node)
+        tree2._set_root(_VIRTUAL, 0)
+        tree2._reindex(())
     
 
-    """splits the dictionary at a given node
+    """splits the dictionary at a given node in O(log n), leaving self empty
 
     @type node: AVLNode
     @pre: node is in self
@@ -529,67 +1601,371 @@ class AVLTree(object):
     dictionary larger than node.key.
     """
     def split(self, node):
-        # Create two empty trees
-        tree1 = AVLTree() 
-        tree2 = AVLTree() 
-
         # If the given node is None, return empty trees
         if node is None:
             return None, None
-        
-        # Detach the left and right subtree of the node and
-        #  ssign it to tree2 and tree1 respectively
-        if node.left.is_real_node():
-            tree2.root = node.left
-            node.left.parent = None # Detach
+        self._finger = None # self is taken apart
+
+        left, _, right = self._split_roots(self.root, node.key) # O(log n)
+        left_max, right_min = node.pred, node.succ
+
+        # Cut the in-order threads on both sides of node
+        if left_max is not None:
+            left_max.succ = None
+        if right_min is not None:
+            right_min.pred = None
+        node.pred = node.succ = None
+
+        # The extremes of both parts are known, so no walks are needed - O(1)
+        tree1 = self._empty_copy()
+        tree2 = self._empty_copy()
+        tree1._set_root(left, left.size, self._min, left_max)
+        tree2._set_root(right, right.size, right_min, self._max)
+
+        if self._index is not None: # the larger part keeps the index - O(min(left, right))
+            index = self._index
+            del index[node.key]
+            smaller, larger = (tree1, tree2) if left.size <= right.size else (tree2, tree1)
+            smaller._reindex(self._subtree_nodes(smaller.root or _VIRTUAL))
+            for key in smaller._index:
+                del index[key]
+            larger._index = index
+            self._reindex(())
+        self._set_root(_VIRTUAL, 0)
+        return tree1, tree2
 
-        if node.right.is_real_node():
-            tree1.root = node.right
-            node.right.parent = None # Detach   
-        
-        # Traverse up the tree to split the remaining structure
-        while node.parent is not None:
-            temp_tree = AVLTree()
-            if node.parent.left == node:
-                # If the current node is the left child, detach the parent's right subtree
-                temp_tree.root = node.parent.right
-                if temp_tree.root.is_real_node():
-                    node.parent.right.parent = None  # Detach the subtree
-                     # Join the detached subtree and the parent to tree1
-                    tree1.join(temp_tree, node.parent.key, node.parent.value)
-                
+    
+    """merges another AVLTree into self, leaving tree2 empty
+
+    Splits the larger tree at the keys of the smaller one and joins the pieces back.
+    Runs in O(m log(n/m + 1)) splitting and joining, plus O(m log n) to thread the nodes of
+    the smaller tree into the larger one, where m <= n are the sizes of the trees.
+
+    @type tree2: AVLTree
+    @param tree2: a dictionary created with the same configuration as self, except that either
+    may keep an index; self keeps its own (rebuilt in O(n + m) if only the smaller tree had one)
+    @type merge: function
+    @param merge: merge(value in self, value in tree2) gives the value of a key found in both
+    trees, by default the value from tree2. With a key function such a key keeps either record
+    @type workers: int
+    @param workers: if more than 1, the trees are merged in key ranges on that many processes
+    and self is rebuilt from new nodes; worth it for trees of millions of keys.
+    merge must then be picklable (a top-level function)
+    @raises ValueError: if the trees have duplicates
+    """
+    def union(self, tree2, merge=None, workers=None):
+        self._check_set_algebra("union")
+        if workers is not None and workers > 1:
+            self._set_algebra_parallel(tree2, "union", merge, workers)
+            return
+        if merge is None:
+            merge = _take_second
+        self_root = self.root if self.root is not None else _VIRTUAL
+        other_root = tree2.root if tree2.root is not None else _VIRTUAL
+        created = []
+        if self._size >= tree2.size():
+            root = self._union_roots(self_root, other_root, merge, created)
+            index = self._index
+        else:
+            root = self._union_roots(other_root, self_root, lambda big, small: merge(small, big), created)
+            index = tree2._index if self._index is not None else None
+        for node in created: # O(m log n)
+            self._thread(node)
+            if index is not None:
+                index[node.key] = node
+        self._set_root(root, root.size)
+        if self._index is not None and index is None: # the larger tree2 kept no index - O(n + m)
+            index = {node.key: node for node in self._iter_nodes()}
+        self._index = index
+        tree2._set_root(_VIRTUAL, 0)
+        tree2._reindex(())
+
+    """keeps in self only the keys that are also in another AVLTree, leaving tree2 empty
+
+    Runs in O(m log(n/m + 1)), where m <= n are the sizes of the trees.
+
+    @type tree2: AVLTree
+    @param tree2: a dictionary created with the same configuration as self
+    @type merge: function
+    @param merge: merge(value in self, value in tree2) gives the value of a kept key,
+    by default the value from tree2
+    @type workers: int
+    @param workers: as in union
+    @raises ValueError: if the trees have duplicates
+    """
+    def intersection(self, tree2, merge=None, workers=None):
+        self._check_set_algebra("intersection")
+        if workers is not None and workers > 1:
+            self._set_algebra_parallel(tree2, "intersection", merge, workers)
+            return
+        if merge is None:
+            merge = _take_second
+        self_root = self.root if self.root is not None else _VIRTUAL
+        other_root = tree2.root if tree2.root is not None else _VIRTUAL
+        if self._size >= tree2.size():
+            root = self._intersection_roots(self_root, other_root, merge)
+        else:
+            root = self._intersection_roots(other_root, self_root, lambda big, small: merge(small, big))
+        nodes = self._subtree_nodes(root) # O(m), the result holds at most m keys
+        self._thread_list(nodes)
+        self._reindex(nodes)
+        self._set_root(root, root.size)
+        tree2._set_root(_VIRTUAL, 0)
+        tree2._reindex(())
+
+    """removes from self the keys that are in another AVLTree, leaving tree2 empty
+
+    Runs in O(m log(n/m + 1)), where m <= n are the sizes of the trees.
+
+    @type tree2: AVLTree
+    @param tree2: a dictionary created with the same configuration as self
+    @type workers: int
+    @param workers: as in union
+    @raises ValueError: if the trees have duplicates
+    """
+    def difference(self, tree2, workers=None):
+        self._check_set_algebra("difference")
+        if workers is not None and workers > 1:
+            self._set_algebra_parallel(tree2, "difference", None, workers)
+            return
+        self_root = self.root if self.root is not None else _VIRTUAL
+        other_root = tree2.root if tree2.root is not None else _VIRTUAL
+        root = self._difference_roots(self_root, other_root)
+        self._set_root(root, root.size)
+        tree2._set_root(_VIRTUAL, 0)
+        tree2._reindex(())
+
+    """iterates over the keys of the dictionary in ascending order
+
+    @rtype: generator
+    """
+    def __iter__(self):
+        if self._duplicates is not None or self._key_func is not None:
+            return self.keys()
+        return (node.key for node in self._iter_nodes())
+
+    """iterates over the keys of the dictionary in descending order
+
+    @rtype: generator
+    """
+    def __reversed__(self):
+        if self._duplicates is not None or self._key_func is not None:
+            return self.keys(reverse=True)
+        return (node.key for node in self._iter_nodes(reverse=True))
+
+    """iterates over the keys of the dictionary in ascending order, optionally within a range
+
+    Takes the same arguments as items.
+
+    @rtype: generator
+    """
+    def keys(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        if self._duplicates is not None:
+            for key, _ in self._iter_occurrences(lo, hi, inclusive, reverse, limit):
+                yield key
+            return
+        if self._key_func is not None:
+            for node in self._iter_range(self._cmp_key(lo), self._cmp_key(hi), inclusive, reverse, limit):
+                yield node.record
+            return
+        for node in self._iter_range(lo, hi, inclusive, reverse, limit):
+            yield node.key
+
+    """iterates over the values of the dictionary in ascending order of their keys,
+    optionally within a range
+
+    Takes the same arguments as items.
+
+    @rtype: generator
+    """
+    def values(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        if self._duplicates is not None:
+            for _, val in self._iter_occurrences(lo, hi, inclusive, reverse, limit):
+                yield val
+            return
+        for node in self._iter_range(self._cmp_key(lo), self._cmp_key(hi), inclusive, reverse, limit):
+            yield node.value
+
+    """iterates over the items of the dictionary in ascending order of their keys,
+    optionally within a range, in O(log n + k) for k items
+
+    @type lo: int
+    @param lo: the lower bound of the keys, None for no bound
+    @type hi: int
+    @param hi: the upper bound of the keys, None for no bound
+    @type inclusive: (bool, bool)
+    @param inclusive: whether lo and hi themselves are included
+    @type reverse: bool
+    @param reverse: iterate in descending order of keys
+    @type limit: int
+    @param limit: the maximal number of items, None for no limit
+    @rtype: generator
+    @returns: a generator of (key, value) touples; with duplicates, one per occurrence
+    (a bucket yields its values in insertion order, reversed if reverse)
+    """
+    def items(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        if self._duplicates is not None:
+            yield from self._iter_occurrences(lo, hi, inclusive, reverse, limit)
+            return
+        if self._key_func is not None:
+            for node in self._iter_range(self._cmp_key(lo), self._cmp_key(hi), inclusive, reverse, limit):
+                yield node.record, node.value
+            return
+        for node in self._iter_range(lo, hi, inclusive, reverse, limit):
+            yield node.key, node.value
+
+    def _rank(self, key, inclusive=False):
+        """Returns the number of keys below key (or equal, if inclusive) in O(log n)."""
+        node = self.root if self.root is not None else _VIRTUAL
+        rank = 0
+        while node.is_real_node():
+            if node.key < key or (inclusive and node.key == key):
+                rank += node.left.size + node.count
+                node = node.right
             else:
-                # If the current node is the right child, detach the parent's left subtree
-                temp_tree.root = node.parent.left
-                if node.parent.left.is_real_node():
-                    node.parent.left.parent = None  # Detach the subtree
-                    # Join the detached subtree and the parent to tree1
-                    tree2.join(temp_tree, node.parent.key, node.parent.value)
-            node = node.parent   # Move up to the parent node
+                node = node.left
+        return rank
 
-        return tree2, tree1
+    """returns the number of keys in the dictionary smaller than key
+
+    @type key: int
+    @param key: a key, not necessarily in the dictionary
+    @rtype: int
+    @returns: the number of keys smaller than key, which is the index of key in avl_to_array
+    if it is in the dictionary
+    """
+    def rank(self, key):
+        return self._rank(self._cmp_key(key)) # O(log n)
+
+    """returns the node with the i-th smallest key
+
+    @type i: int
+    @param i: a 0-based index into the keys in ascending order; negative values count from the end.
+    With duplicates the index counts every occurrence, as in avl_to_array
+    @rtype: AVLNode
+    @returns: the node, None if i is out of range
+    """
+    def select(self, i):
+        size = self.root.size if self.root is not None else 0
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            return None
+        node = self.root
+        while True: # O(log n)
+            left_size = node.left.size
+            if i < left_size:
+                node = node.left
+            elif i < left_size + node.count:
+                return node
+            else:
+                i -= left_size + node.count
+                node = node.right
+
+    """returns the number of keys between lo and hi
+
+    @type lo: int
+    @param lo: the lower bound of the keys, None for no bound
+    @type hi: int
+    @param hi: the upper bound of the keys, None for no bound
+    @type inclusive: (bool, bool)
+    @param inclusive: whether lo and hi themselves are counted
+    @rtype: int
+    """
+    def count_range(self, lo=None, hi=None, inclusive=(True, True)):
+        lo, hi = self._cmp_key(lo), self._cmp_key(hi)
+        lo_inclusive, hi_inclusive = inclusive
+        size = self.root.size if self.root is not None else 0
+        above = self._rank(hi, inclusive=hi_inclusive) if hi is not None else size # O(log n)
+        below = self._rank(lo, inclusive=not lo_inclusive) if lo is not None else 0 # O(log n)
+        return max(above - below, 0)
+
+    """replaces the value of a node, keeping the aggregates of its ancestors current
+
+    @type node: AVLNode
+    @pre: node is a real pointer to a node in self
+    @param val: the new value
+    """
+    def set_value(self, node, val):
+        node.value = val
+        if self._combine is not None:
+            while node is not None: # O(log n)
+                self._update_aggregate(node)
+                node = node.parent
+
+    def _aggregate_above(self, node:AVLNode, lo, inclusive):
+        """Combines the values of the keys above lo (or equal, if inclusive) in the subtree of node."""
+        combine = self._combine
+        result = self._identity
+        while node.is_real_node(): # O(log n), the pieces are found right to left
+            if node.key > lo or (inclusive and node.key == lo):
+                piece = combine(node.value, node.right.agg) if node.right.is_real_node() else node.value
+                result = combine(piece, result)
+                node = node.left
+            else:
+                node = node.right
+        return result
+
+    def _aggregate_below(self, node:AVLNode, hi, inclusive):
+        """Combines the values of the keys below hi (or equal, if inclusive) in the subtree of node."""
+        combine = self._combine
+        result = self._identity
+        while node.is_real_node(): # O(log n), the pieces are found left to right
+            if node.key < hi or (inclusive and node.key == hi):
+                piece = combine(node.left.agg, node.value) if node.left.is_real_node() else node.value
+                result = combine(result, piece)
+                node = node.right
+            else:
+                node = node.left
+        return result
+
+    """combines the values of the keys between lo and hi, in key order, in O(log n)
+
+    @pre: self was created with combine
+    @type lo: int
+    @param lo: the lower bound of the keys, None for no bound
+    @type hi: int
+    @param hi: the upper bound of the keys, None for no bound
+    @type inclusive: (bool, bool)
+    @param inclusive: whether lo and hi themselves are included
+    @returns: the aggregate of the values in the range, identity if it is empty
+    """
+    def aggregate(self, lo=None, hi=None, inclusive=(True, True)):
+        if self._combine is None:
+            raise ValueError("aggregate needs a tree created with a combine function")
+        lo, hi = self._cmp_key(lo), self._cmp_key(hi)
+        lo_inclusive, hi_inclusive = inclusive
+        combine = self._combine
+
+        # Find the highest node inside the range; the range splits into its two sides there
+        node = self.root if self.root is not None else _VIRTUAL
+        while node.is_real_node(): # O(log n)
+            if lo is not None and (node.key < lo or (node.key == lo and not lo_inclusive)):
+                node = node.right
+            elif hi is not None and (node.key > hi or (node.key == hi and not hi_inclusive)):
+                node = node.left
+            else:
+                break
+        if not node.is_real_node():
+            return self._identity
+
+        if lo is None:
+            left = node.left.agg if node.left.is_real_node() else self._identity
+        else:
+            left = self._aggregate_above(node.left, lo, lo_inclusive) # O(log n)
+        if hi is None:
+            right = node.right.agg if node.right.is_real_node() else self._identity
+        else:
+            right = self._aggregate_below(node.right, hi, hi_inclusive) # O(log n)
+        return combine(combine(left, node.value), right)
 
-    
     """returns an array representing dictionary 
 
     @rtype: list
     @returns: a sorted list according to key of touples (key, value) representing the data structure
     """
     def avl_to_array(self):
-        """
-        Recursive helper function to traverse the tree in in-order fashion.
-        @type node: AVLNode
-        @param node: The current node being processed.
-        @rtype: list
-        @returns: A list of (key, value) tuples from the subtree rooted at `node`.
-        """
-        def avl_to_array_helper(node):
-            # If the node is None or a virtual node, return an empty list
-            if node is None or node.height == -1:
-                return []
-            # Traverse the left subtree, process the current node, then the right subtree
-            return avl_to_array_helper(node.left) + [(node.key, node.value)] + avl_to_array_helper(node.right) # O(k/2) + O(k/2) = O(k) for tree of size k
-        return avl_to_array_helper(self.root) # O(n)
+        return list(self.items()) # O(n)
         
     """returns the node with the maximal key in the dictionary
 
@@ -615,6 +1991,47 @@ class AVLTree(object):
     def get_root(self):
         return self.root
 
+    """starts collecting statistics about self, replacing any collected before
+
+    Counting works by wrapping the instrumented methods on self, so a tree that never enabled
+    stats (or disabled them) pays nothing at all. Trees made by split start without stats.
+
+    @type timing: bool
+    @param timing: also keep a histogram of the time each operation took
+    @type hook: function
+    @param hook: called as hook(operation, seconds) after every instrumented operation,
+    e.g. to export metrics
+    @rtype: AVLTreeStats
+    @returns: the statistics, updated in place while they are enabled
+    """
+    def enable_stats(self, timing=False, hook=None):
+        self.disable_stats()
+        stats = self._stats = AVLTreeStats(timing, hook)
+        for name, event in self._STATS_EVENTS:
+            setattr(self, name, _counted(getattr(self, name), stats.counts, event))
+        self._update_min_max = _counted_min_max(self._update_min_max, stats.counts)
+        for name in self._STATS_OPERATIONS:
+            setattr(self, name, _timed(getattr(self, name), stats, name))
+        return stats
+
+    """stops collecting statistics, restoring the uninstrumented methods
+    """
+    def disable_stats(self):
+        for name, _ in self._STATS_EVENTS:
+            self.__dict__.pop(name, None)
+        self.__dict__.pop('_update_min_max', None)
+        for name in self._STATS_OPERATIONS:
+            self.__dict__.pop(name, None)
+        self._stats = None
+
+    """returns the statistics being collected
+
+    @rtype: AVLTreeStats
+    @returns: the statistics, None if they are not enabled
+    """
+    def stats(self):
+        return self._stats
+
     def print_tree_with_heights(self):
         if not self.root:
             print('<empty tree>')
@@ -0,0 +1,596 @@
+from array import array
+
+
+"""Index of the virtual node: every empty child slot and every missing parent holds it"""
+VIRTUAL = -1
+
+
+class _NodePool(object):
+    """Parallel typed arrays holding the nodes of one or more ArrayAVLTrees.
+
+    A node is an index into the arrays. Trees produced by split share the pool of the
+    tree they came from, so joining them back never copies nodes.
+    """
+    __slots__ = ('keys', 'values', 'heights', 'sizes', 'left', 'right', 'parent', 'free')
+
+    def __init__(self):
+        self.keys = array('q')
+        self.values = []
+        self.heights = array('b')
+        self.sizes = array('i')
+        self.left = array('i')
+        self.right = array('i')
+        self.parent = array('i')
+        self.free = array('i') # slots of deleted nodes, reused by alloc
+
+    def alloc(self, key, value):
+        if self.free:
+            node = self.free.pop()
+            self.keys[node] = key
+            self.values[node] = value
+            self.heights[node] = 0
+            self.sizes[node] = 1
+            self.left[node] = VIRTUAL
+            self.right[node] = VIRTUAL
+            self.parent[node] = VIRTUAL
+            return node
+        self.keys.append(key)
+        self.values.append(value)
+        self.heights.append(0)
+        self.sizes.append(1)
+        self.left.append(VIRTUAL)
+        self.right.append(VIRTUAL)
+        self.parent.append(VIRTUAL)
+        return len(self.keys) - 1
+
+    def release(self, node):
+        self.values[node] = None # drop the reference to the value
+        self.free.append(node)
+        if len(self.free) == len(self.keys): # no tree holds a node here any more
+            self.clear()
+
+    def clear(self):
+        """Drops every slot, giving the memory of the arrays back."""
+        for buf in (self.keys, self.heights, self.sizes, self.left, self.right, self.parent, self.free):
+            del buf[:]
+        del self.values[:]
+
+    def nbytes(self):
+        """Bytes held by the typed arrays and the value list (not the values themselves)."""
+        total = 0
+        for buf in (self.keys, self.heights, self.sizes, self.left, self.right, self.parent, self.free):
+            total += buf.buffer_info()[1] * buf.itemsize
+        return total + 8 * len(self.values)
+
+
+"""
+A class implementing an AVL tree over int keys, stored in parallel typed arrays.
+It has the public API of AVLTree.AVLTree; nodes are int indexes instead of AVLNode objects,
+read with get_key/get_value.
+"""
+
+class ArrayAVLTree(object):
+
+    def __init__(self, _pool=None):
+        self._pool = _pool if _pool is not None else _NodePool()
+        self.root = VIRTUAL
+        self._min = VIRTUAL
+        self._max = VIRTUAL
+        self._finger = VIRTUAL # last node found or inserted, see last_accessed
+
+    def _height(self, node):
+        return self._pool.heights[node] if node != VIRTUAL else -1
+
+    def _update(self, node):
+        pool = self._pool
+        left, right = pool.left[node], pool.right[node]
+        if left != VIRTUAL:
+            left_height, left_size = pool.heights[left], pool.sizes[left]
+        else:
+            left_height, left_size = -1, 0
+        if right != VIRTUAL:
+            right_height, right_size = pool.heights[right], pool.sizes[right]
+        else:
+            right_height, right_size = -1, 0
+        pool.heights[node] = 1 + max(left_height, right_height)
+        pool.sizes[node] = 1 + left_size + right_size
+
+    def _balance(self, node):
+        pool = self._pool
+        return self._height(pool.left[node]) - self._height(pool.right[node])
+
+    def _replace_child(self, parent, old, new):
+        """Puts new where old hung under parent; a parentless subtree root is tracked by the caller."""
+        pool = self._pool
+        if parent != VIRTUAL:
+            if pool.left[parent] == old:
+                pool.left[parent] = new
+            else:
+                pool.right[parent] = new
+        if new != VIRTUAL:
+            pool.parent[new] = parent
+
+    def _rotate_left(self, node):
+        pool = self._pool
+        new_root = pool.right[node]
+        middle = pool.left[new_root]
+
+        pool.right[node] = middle
+        if middle != VIRTUAL:
+            pool.parent[middle] = node
+        self._replace_child(pool.parent[node], node, new_root)
+        pool.left[new_root] = node
+        pool.parent[node] = new_root
+
+        self._update(node)
+        self._update(new_root)
+        return new_root
+
+    def _rotate_right(self, node):
+        pool = self._pool
+        new_root = pool.left[node]
+        middle = pool.right[new_root]
+
+        pool.left[node] = middle
+        if middle != VIRTUAL:
+            pool.parent[middle] = node
+        self._replace_child(pool.parent[node], node, new_root)
+        pool.right[new_root] = node
+        pool.parent[node] = new_root
+
+        self._update(node)
+        self._update(new_root)
+        return new_root
+
+    def _rebalance(self, node):
+        """Rebalances the subtree at node (children already balanced), returns its new root."""
+        pool = self._pool
+        balance = self._balance(node)
+        if balance > 1: # left heavy
+            if self._balance(pool.left[node]) < 0: # double rotation
+                self._rotate_left(pool.left[node])
+            return self._rotate_right(node)
+        if balance < -1: # right heavy
+            if self._balance(pool.right[node]) > 0: # double rotation
+                self._rotate_right(pool.right[node])
+            return self._rotate_left(node)
+        return node
+
+    def _retrace(self, node):
+        """Updates and rebalances every node from node up to the top, returns the top."""
+        parent = self._pool.parent
+        top = node
+        while node != VIRTUAL: # O(log n)
+            self._update(node)
+            top = self._rebalance(node)
+            node = parent[top]
+        return top
+
+    def _find_min(self, node):
+        left = self._pool.left
+        while left[node] != VIRTUAL:
+            node = left[node]
+        return node
+
+    def _find_max(self, node):
+        right = self._pool.right
+        while right[node] != VIRTUAL:
+            node = right[node]
+        return node
+
+    def _successor(self, node):
+        pool = self._pool
+        if pool.right[node] != VIRTUAL:
+            return self._find_min(pool.right[node])
+        while pool.parent[node] != VIRTUAL and pool.right[pool.parent[node]] == node:
+            node = pool.parent[node]
+        return pool.parent[node]
+
+    def _predecessor(self, node):
+        pool = self._pool
+        if pool.left[node] != VIRTUAL:
+            return self._find_max(pool.left[node])
+        while pool.parent[node] != VIRTUAL and pool.left[pool.parent[node]] == node:
+            node = pool.parent[node]
+        return pool.parent[node]
+
+    def _search(self, key, root):
+        """Returns (node, parent, edges) like AVLTree._search; node is VIRTUAL if key is missing."""
+        keys, left, right = self._pool.keys, self._pool.left, self._pool.right
+        edges = 0
+        parent = VIRTUAL
+        node = root
+        while node != VIRTUAL: # O(log n)
+            node_key = keys[node]
+            if node_key == key:
+                return node, self._pool.parent[node], edges + 1
+            parent = node
+            node = right[node] if node_key < key else left[node]
+            edges += 1
+        return node, parent, edges + 1
+
+    def _insert(self, root, key, val):
+        pool = self._pool
+        new_node = pool.alloc(key, val)
+        if root == VIRTUAL:
+            self.root = new_node
+            return new_node, 0, 0
+
+        _, current_node, edges = self._search(key, root) # O(log n)
+        if pool.keys[current_node] < key:
+            pool.right[current_node] = new_node
+        else:
+            pool.left[current_node] = new_node
+        pool.parent[new_node] = current_node
+
+        # Same promote accounting as AVLTree._insert
+        promote = 0
+        self._update(current_node)
+        balance = self._balance(current_node)
+        while abs(balance) < 2: # O(log n)
+            promote += 1
+            if pool.parent[current_node] == VIRTUAL:
+                break
+            current_node = pool.parent[current_node]
+            self._update(current_node)
+            balance = self._balance(current_node)
+
+        subtree_root = self._rebalance(current_node) # O(1)
+        top = pool.parent[subtree_root]
+        while top != VIRTUAL: # sizes above the rotation still miss the new node
+            self._update(top)
+            subtree_root, top = top, pool.parent[top]
+        self.root = subtree_root
+        return new_node, edges, promote
+
+    def _join(self, left_root, node, right_root):
+        """Joins left_root < node < right_root (parentless subtrees), returns the new root."""
+        pool = self._pool
+        left_height, right_height = self._height(left_root), self._height(right_root)
+
+        if abs(left_height - right_height) <= 1:
+            pool.left[node], pool.right[node], pool.parent[node] = left_root, right_root, VIRTUAL
+            if left_root != VIRTUAL:
+                pool.parent[left_root] = node
+            if right_root != VIRTUAL:
+                pool.parent[right_root] = node
+            self._update(node)
+            return node
+
+        attach_parent = VIRTUAL
+        if left_height > right_height: # walk down the right spine of the taller left tree
+            attach = left_root
+            while self._height(attach) > right_height + 1:
+                attach_parent, attach = attach, pool.right[attach]
+            pool.left[node], pool.right[node] = attach, right_root
+        else: # walk down the left spine of the taller right tree
+            attach = right_root
+            while self._height(attach) > left_height + 1:
+                attach_parent, attach = attach, pool.left[attach]
+            pool.left[node], pool.right[node] = left_root, attach
+
+        if pool.left[node] != VIRTUAL:
+            pool.parent[pool.left[node]] = node
+        if pool.right[node] != VIRTUAL:
+            pool.parent[pool.right[node]] = node
+        if left_height > right_height:
+            pool.right[attach_parent] = node
+        else:
+            pool.left[attach_parent] = node
+        pool.parent[node] = attach_parent
+        self._update(node)
+        return self._retrace(attach_parent) # O(log n)
+
+    def _adopt(self, tree):
+        """Moves the nodes of a tree living in another pool into self's pool, returns the new root.
+        The slots of tree's nodes are released in the other pool, which other trees may share."""
+        if tree.root == VIRTUAL:
+            return VIRTUAL
+        src, dst = tree._pool, self._pool
+        new_root = dst.alloc(src.keys[tree.root], src.values[tree.root])
+        stack = [(tree.root, new_root)]
+        while stack: # O(m)
+            old, new = stack.pop()
+            dst.heights[new] = src.heights[old]
+            dst.sizes[new] = src.sizes[old]
+            for links in ('left', 'right'):
+                child = getattr(src, links)[old]
+                if child != VIRTUAL:
+                    copy = dst.alloc(src.keys[child], src.values[child])
+                    getattr(dst, links)[new] = copy
+                    dst.parent[copy] = new
+                    stack.append((child, copy))
+            src.release(old)
+        return new_root
+
+    def _set_root(self, root):
+        self.root = root
+        self._finger = VIRTUAL
+        if root == VIRTUAL:
+            self._min = self._max = VIRTUAL
+        else:
+            self._pool.parent[root] = VIRTUAL
+            self._min = self._find_min(root) # O(log n)
+            self._max = self._find_max(root) # O(log n)
+
+    """returns the key stored at node
+
+    @type node: int
+    @rtype: int
+    """
+    def get_key(self, node):
+        return self._pool.keys[node]
+
+    """returns the value stored at node
+
+    @type node: int
+    @rtype: any
+    """
+    def get_value(self, node):
+        return self._pool.values[node]
+
+    """searches for a node in the dictionary corresponding to the key (starting at the root)
+
+    @type key: int
+    @param key: a key to be searched
+    @rtype: (int,int)
+    @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+    and e is the number of edges on the path between the starting node and ending node+1.
+    """
+    def search(self, key):
+        if self.root == VIRTUAL: # Empty tree
+            return None, -1
+        node, _, edges = self._search(key, self.root) # O(log n)
+        if node != VIRTUAL:
+            self._finger = node
+            return node, edges
+        return None, edges
+
+    def _climb(self, start, key):
+        """Climbs from start to the lowest ancestor whose subtree spans the position of key,
+        like AVLTree._climb, returns (node, edges climbed). O(log d)."""
+        pool = self._pool
+        keys, parents, left = pool.keys, pool.parent, pool.left
+        if key > keys[self._max]: # hangs right below the extreme, see AVLTree._climb
+            return self._max, 0
+        if key < keys[self._min]:
+            return self._min, 0
+        node = start
+        edges = 0
+        while keys[node] != key and parents[node] != VIRTUAL: # O(log d)
+            parent = parents[node]
+            if left[parent] == node:
+                if keys[node] < key < keys[parent]:
+                    break
+            elif keys[parent] < key < keys[node]:
+                break
+            node = parent
+            edges += 1
+        return node, edges
+
+    """searches for a node in the dictionary corresponding to the key, starting at a finger
+
+    @type key: int
+    @param key: a key to be searched
+    @type start: int
+    @param start: the node to start from, e.g. last_accessed(); None starts at the max
+    @rtype: (int,int)
+    @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+    and e is the number of edges climbed from the starting node and walked down to the ending node+1.
+    """
+    def finger_search(self, key, start=None):
+        if self.root == VIRTUAL:
+            return None, -1
+        node, climb_edges = self._climb(start if start is not None else self._max, key) # O(log d)
+        found_node, _, path = self._search(key, node) # O(log d)
+        if found_node != VIRTUAL:
+            self._finger = found_node
+            return found_node, climb_edges + path
+        return None, climb_edges + path
+
+    """returns the node most recently found or inserted, to be passed as the start of the next
+    finger operation
+
+    @rtype: int
+    @returns: the node, None if there is none or it has left the dictionary
+    """
+    def last_accessed(self):
+        return self._finger if self._finger != VIRTUAL else None
+
+    """inserts a new node into the dictionary with corresponding key and value (starting at the root)
+
+    @type key: int
+    @pre: key currently does not appear in the dictionary
+    @param key: key of item that is to be inserted to self
+    @type val: any
+    @param val: the value of the item
+    @rtype: (int,int,int)
+    @returns: a 3-tuple (x,e,h) where x is the new node,
+    e is the number of edges on the path between the starting node and new node before rebalancing,
+    and h is the number of PROMOTE cases during the AVL rebalancing
+    """
+    def insert(self, key, val):
+        new_node, edges, promote = self._insert(self.root, key, val) # O(log n)
+        keys = self._pool.keys
+        if self._max == VIRTUAL:
+            self._min = self._max = new_node
+        elif key > keys[self._max]:
+            self._max = new_node
+        elif key < keys[self._min]:
+            self._min = new_node
+        self._finger = new_node
+        return new_node, edges, promote
+
+    """inserts a new node into the dictionary with corresponding key and value, starting at a finger
+
+    @type key: int
+    @pre: key currently does not appear in the dictionary
+    @param key: key of item that is to be inserted to self
+    @type val: any
+    @param val: the value of the item
+    @type start: int
+    @param start: the node to start from, e.g. last_accessed(); None starts at the max
+    @rtype: (int,int,int)
+    @returns: a 3-tuple (x,e,h) as in insert
+    """
+    def finger_insert(self, key, val, start=None):
+        if self._max == VIRTUAL:
+            return self.insert(key, val)
+        pool = self._pool
+        current_node, search_edges = self._climb(start if start is not None else self._max, key) # O(log d)
+
+        new_node, insert_edges, promote = self._insert(current_node, key, val) # O(log d)
+        if key > pool.keys[self._max]:
+            self._max = new_node
+        elif key < pool.keys[self._min]:
+            self._min = new_node
+        self._finger = new_node
+        return new_node, search_edges + insert_edges, promote
+
+    """deletes node from the dictionary
+
+    @type node: int
+    @pre: node is a real node in self
+    """
+    def delete(self, node):
+        pool = self._pool
+        if node == self._finger:
+            self._finger = VIRTUAL
+        if node == self._min:
+            self._min = self._successor(node)
+        if node == self._max:
+            self._max = self._predecessor(node)
+
+        left, right, parent = pool.left[node], pool.right[node], pool.parent[node]
+        if left == VIRTUAL or right == VIRTUAL: # leaf or unary node
+            child = left if left != VIRTUAL else right
+            self._replace_child(parent, node, child)
+            if parent == VIRTUAL:
+                self.root = child
+            retrace_from = parent
+        else: # swap in the successor
+            replacement = self._find_min(right)
+            retrace_from = pool.parent[replacement]
+            if retrace_from != node:
+                self._replace_child(retrace_from, replacement, pool.right[replacement])
+                pool.right[replacement] = right
+                pool.parent[right] = replacement
+            else:
+                retrace_from = replacement
+            pool.left[replacement] = left
+            pool.parent[left] = replacement
+            self._replace_child(parent, node, replacement)
+            if parent == VIRTUAL:
+                self.root = replacement
+
+        pool.release(node)
+        if retrace_from != VIRTUAL:
+            self.root = self._retrace(retrace_from) # O(log n)
+
+    """joins self with item and another ArrayAVLTree
+
+    @type tree2: ArrayAVLTree
+    @param tree2: a dictionary to be joined with self, left empty afterwards
+    @type key: int
+    @param key: the key separting self and tree2
+    @type val: any
+    @param val: the value corresponding to key
+    @pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+    or the opposite way
+    """
+    def join(self, tree2, key, val):
+        pool = self._pool
+        other_root = tree2.root if tree2._pool is self._pool else self._adopt(tree2) # O(1) or O(m)
+        node = pool.alloc(key, val)
+
+        if (self.root != VIRTUAL and pool.keys[self.root] < key) or \
+                (other_root != VIRTUAL and pool.keys[other_root] > key):
+            root = self._join(self.root, node, other_root) # O(log n)
+        else:
+            root = self._join(other_root, node, self.root) # O(log n)
+        tree2._set_root(VIRTUAL)
+        self._set_root(root)
+
+    """splits the dictionary at a given node
+
+    @type node: int
+    @pre: node is in self
+    @param node: the node in the dictionary to be used for the split
+    @rtype: (ArrayAVLTree, ArrayAVLTree)
+    @returns: a tuple (left, right), where left is an ArrayAVLTree representing the keys in the
+    dictionary smaller than the key of node, and right is an ArrayAVLTree representing the keys in
+    the dictionary larger than it. Both share self's node pool; self is left empty.
+    """
+    def split(self, node):
+        pool = self._pool
+        left_root, right_root = pool.left[node], pool.right[node]
+        if left_root != VIRTUAL:
+            pool.parent[left_root] = VIRTUAL
+        if right_root != VIRTUAL:
+            pool.parent[right_root] = VIRTUAL
+
+        current_node, parent = node, pool.parent[node]
+        while parent != VIRTUAL: # O(log n) joins
+            next_parent = pool.parent[parent]
+            if pool.right[parent] == current_node: # parent and its left subtree are smaller
+                subtree = pool.left[parent]
+                if subtree != VIRTUAL:
+                    pool.parent[subtree] = VIRTUAL
+                left_root = self._join(subtree, parent, left_root)
+            else: # parent and its right subtree are larger
+                subtree = pool.right[parent]
+                if subtree != VIRTUAL:
+                    pool.parent[subtree] = VIRTUAL
+                right_root = self._join(right_root, parent, subtree)
+            current_node, parent = parent, next_parent
+
+        pool.release(node)
+        left_tree, right_tree = ArrayAVLTree(pool), ArrayAVLTree(pool)
+        left_tree._set_root(left_root)
+        right_tree._set_root(right_root)
+        self._set_root(VIRTUAL)
+        return left_tree, right_tree
+
+    """returns an array representing dictionary
+
+    @rtype: list
+    @returns: a sorted list according to key of touples (key, value) representing the data structure
+    """
+    def avl_to_array(self):
+        pool = self._pool
+        keys, values, left, right = pool.keys, pool.values, pool.left, pool.right
+        result = []
+        stack = []
+        node = self.root
+        while stack or node != VIRTUAL: # O(n)
+            while node != VIRTUAL:
+                stack.append(node)
+                node = left[node]
+            node = stack.pop()
+            result.append((keys[node], values[node]))
+            node = right[node]
+        return result
+
+    """returns the node with the maximal key in the dictionary
+
+    @rtype: int
+    @returns: the maximal node, None if the dictionary is empty
+    """
+    def max_node(self):
+        return self._max if self._max != VIRTUAL else None
+
+    """returns the number of items in dictionary
+
+    @rtype: int
+    @returns: the number of items in dictionary
+    """
+    def size(self):
+        return self._pool.sizes[self.root] if self.root != VIRTUAL else 0
+
+    """returns the root of the tree representing the dictionary
+
+    @rtype: int
+    @returns: the root, None if the dictionary is empty
+    """
+    def get_root(self):
+        return self.root if self.root != VIRTUAL else None
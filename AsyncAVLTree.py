@@ -0,0 +1,166 @@
+import asyncio
+import time
+from collections import deque
+
+from AVLTree import AVLTree
+
+
+"""Number of most recent write latencies kept for latency_percentiles"""
+_LATENCY_SAMPLES = 100000
+
+
+"""
+An asyncio front end for AVLTree that coalesces writes. insert and delete queue the key and
+wait; the queue is applied as one sorted batch (delete_many, then insert_many) when it holds
+max_batch writes or max_delay seconds after its first write, whichever comes first, and the
+waiting writers are resumed after that. Only the last write to a key in a batch takes effect,
+except in a tree with duplicates, where every insert adds an occurrence and every delete
+removes one, as AVLTree.insert and AVLTree.delete do.
+
+The tree itself is only touched from the event loop thread, so no locking is needed.
+"""
+
+class AsyncAVLTree(object):
+
+    """Constructor
+
+    @type max_batch: int
+    @param max_batch: the number of queued writes that triggers a flush right away
+    @type max_delay: float
+    @param max_delay: the longest time in seconds a write waits for its batch to fill up
+    @param options: constructor arguments of the underlying AVLTree
+    """
+    def __init__(self, max_batch=256, max_delay=0.001, **options):
+        self._tree = AVLTree(**options)
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        # compared key -> (key, value, is_delete), the last write to each key; with duplicates,
+        # key -> [(value, is_delete), ...], every write to it in order. Keys are compared as the
+        # tree compares them, so with a key function equal records share one entry
+        self._pending = {}
+        self._waiters = [] # (future, enqueue time) of every queued write
+        self._timer = None
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    def _enqueue(self, key, value, is_delete):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._tree._duplicates is not None:
+            self._pending.setdefault(key, []).append((value, is_delete))
+        else:
+            self._pending[self._tree._cmp_key(key)] = (key, value, is_delete)
+        self._waiters.append((future, time.perf_counter()))
+        if len(self._waiters) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._max_delay, self._flush)
+        return future
+
+    def _flush(self):
+        """Applies the queued writes in one batch per kind and resolves their futures."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, waiters = self._pending, self._waiters
+        if not waiters:
+            return
+        self._pending, self._waiters = {}, []
+
+        try:
+            if self._tree._duplicates is not None:
+                self._apply_occurrences(pending)
+            else:
+                self._tree.delete_many([key for key, _, is_delete in pending.values() if is_delete])
+                self._tree.insert_many([(key, value) for key, value, is_delete in pending.values()
+                                        if not is_delete]) # O(k log(n/k + 1)) or O(n + k log k)
+        except Exception as error:
+            for future, _ in waiters:
+                if not future.done(): # the writer may have been cancelled
+                    future.set_exception(error)
+            return
+
+        now = time.perf_counter()
+        for future, start in waiters:
+            self._latencies.append(now - start)
+            if not future.done():
+                future.set_result(None)
+
+    def _apply_occurrences(self, pending):
+        """Applies the writes queued for a tree with duplicates: a delete cancels the latest
+        queued insert of its key, or else removes an occurrence already in the tree."""
+        tree = self._tree
+        items, deletes = [], []
+        for key, writes in pending.items():
+            values = []
+            for value, is_delete in writes:
+                if not is_delete:
+                    values.append(value)
+                elif values:
+                    values.pop()
+                else:
+                    deletes.append(key)
+            items.extend((key, value) for value in values)
+        for key in deletes: # O(log n) each
+            node, _ = tree.search(key)
+            if node is not None:
+                tree.delete(node)
+        tree.insert_many(items)
+
+    """inserts an item, or replaces its value, once the current batch is applied
+
+    @type key: int
+    @param key: key of item that is to be inserted to self
+    @type val: string
+    @param val: the value of the item
+    """
+    async def insert(self, key, val):
+        await self._enqueue(key, val, False)
+
+    """deletes the item with the given key, if any, once the current batch is applied
+    (one occurrence of it, in a tree with duplicates)
+
+    @type key: int
+    @param key: the key to delete
+    """
+    async def delete(self, key):
+        await self._enqueue(key, None, True)
+
+    """searches for a node in the dictionary corresponding to the key
+
+    Queued writes to key are applied first, so a coroutine always reads its own writes.
+
+    @type key: int
+    @param key: a key to be searched
+    @rtype: (AVLNode,int)
+    @returns: a tuple (x,e) as returned by AVLTree.search
+    """
+    async def search(self, key):
+        if self._tree._cmp_key(key) in self._pending:
+            self._flush()
+        return self._tree.search(key)
+
+    """applies the queued writes now
+    """
+    async def flush(self):
+        self._flush()
+
+    """returns the number of items in dictionary, not counting queued writes
+
+    @rtype: int
+    """
+    def size(self):
+        return self._tree.size()
+
+    """returns percentiles of the time writes waited for their batch to be applied
+
+    @type percentiles: iterable
+    @param percentiles: the percentiles to report, between 0 and 100
+    @rtype: dict
+    @returns: a dict from each percentile to a latency in seconds, over the most recent writes;
+    empty if no write was applied yet
+    """
+    def latency_percentiles(self, percentiles=(50, 99)):
+        samples = sorted(self._latencies) # O(s log s)
+        if not samples:
+            return {}
+        return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] for p in percentiles}
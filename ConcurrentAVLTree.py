@@ -0,0 +1,242 @@
+import threading
+import time
+
+from AVLTree import AVLTree
+
+
+"""Optimistic reads that keep racing with writers give up and take the read lock after this many tries"""
+_OPTIMISTIC_RETRIES = 8
+
+
+class _ReadWriteLock(object):
+    """Lets many readers or a single writer in. Waiting writers keep new readers out,
+    so a steady stream of reads cannot starve them.
+    """
+    __slots__ = ('_cond', '_readers', '_writer', '_writers_waiting')
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+"""
+A thread-safe AVL tree: an AVLTree behind a reader/writer lock. Reads run in parallel with
+each other, writes run alone. With optimistic=True, search does not take the lock at all:
+it walks the tree and keeps the result only if no write started or ended meanwhile
+(a sequence lock), falling back to the read lock after repeated conflicts.
+
+Iterating methods return lists, since a generator would hold the lock between steps.
+"""
+
+class ConcurrentAVLTree(object):
+
+    """Constructor
+
+    @type optimistic: bool
+    @param optimistic: whether search tries lock-free version-checked walks first
+    @param options: constructor arguments of the underlying AVLTree
+    """
+    def __init__(self, optimistic=False, **options):
+        self._tree = AVLTree(**options)
+        self._lock = _ReadWriteLock()
+        self._version = 0 # odd while a writer is changing the tree
+        self._optimistic = optimistic
+
+    def _read(self, method, *args):
+        lock = self._lock
+        lock.acquire_read()
+        try:
+            return method(*args)
+        finally:
+            lock.release_read()
+
+    def _write(self, method, *args):
+        lock = self._lock
+        lock.acquire_write()
+        self._version += 1
+        try:
+            return method(*args)
+        finally:
+            self._version += 1
+            lock.release_write()
+
+    def _optimistic_search(self, key):
+        """Searches without locking, returns None if every try raced with a writer."""
+        tree = self._tree
+        if tree._key_func is not None:
+            key = tree._key_func(key)
+        for _ in range(_OPTIMISTIC_RETRIES):
+            version = self._version
+            if version & 1: # a writer is active, let it run
+                time.sleep(0)
+                continue
+            try:
+                node = tree.root
+                limit = 2 * tree._size.bit_length() + 2 # above the height of any AVL tree of this size
+                if node is None:
+                    result = (None, -1)
+                else:
+                    edges = 0
+                    while node.is_real_node() and edges <= limit: # O(log n)
+                        edges += 1
+                        if node.key == key:
+                            break
+                        node = node.right if node.key < key else node.left
+                    if edges > limit: # walked into a half-relinked rotation
+                        continue
+                    result = (node, edges) if node.is_real_node() else (None, edges + 1)
+            except AttributeError: # followed a pointer that was being replaced
+                continue
+            if self._version == version:
+                return result
+        return None
+
+    """searches for a node in the dictionary corresponding to the key
+
+    @type key: int
+    @param key: a key to be searched
+    @rtype: (AVLNode,int)
+    @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+    and e is the number of edges on the path between the starting node and ending node+1.
+    """
+    def search(self, key):
+        if self._optimistic:
+            result = self._optimistic_search(key)
+            if result is not None:
+                return result
+        return self._read(self._tree.search, key)
+
+    """inserts a new node into the dictionary with corresponding key and value
+
+    @type key: int
+    @pre: key currently does not appear in the dictionary
+    @param key: key of item that is to be inserted to self
+    @type val: string
+    @param val: the value of the item
+    @rtype: (AVLNode,int,int)
+    @returns: the 3-tuple (x,e,h) of AVLTree.insert
+    """
+    def insert(self, key, val):
+        return self._write(self._tree.insert, key, val)
+
+    """deletes node from the dictionary, unless another thread already removed it
+
+    @type node: AVLNode
+    @param node: a node returned by an earlier search or insert
+    @rtype: bool
+    @returns: whether node was deleted
+    """
+    def delete(self, node):
+        return self._write(self._delete, node)
+
+    def _delete(self, node):
+        key = node.record if self._tree._key_func is not None else node.key
+        if self._tree.search(key)[0] is not node: # O(log n), stale handle
+            return False
+        self._tree.delete(node)
+        return True
+
+    """inserts a batch of items, replacing the value of keys already in the dictionary
+
+    @type items: iterable
+    @param items: (key, value) pairs, in any order; for repeated keys the last value wins
+    @rtype: int
+    @returns: the number of keys that were not in the dictionary before
+    """
+    def insert_many(self, items):
+        items = list(items) # outside the lock, items may be a slow generator
+        return self._write(self._tree.insert_many, items)
+
+    """deletes a batch of keys, ignoring keys that are not in the dictionary
+
+    @type keys: iterable
+    @param keys: the keys to delete, in any order
+    @rtype: int
+    @returns: the number of keys that were deleted
+    """
+    def delete_many(self, keys):
+        keys = list(keys)
+        return self._write(self._tree.delete_many, keys)
+
+    """returns the items of the dictionary with lo <= key <= hi as a list
+
+    @rtype: list
+    @returns: (key, value) pairs, with the arguments of AVLTree.items
+    """
+    def items(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        return self._read(lambda: list(self._tree.items(lo, hi, inclusive, reverse, limit)))
+
+    """returns the number of keys in the dictionary smaller than key
+
+    @rtype: int
+    """
+    def rank(self, key):
+        return self._read(self._tree.rank, key)
+
+    """returns the node with the i-th smallest key, None if i is out of range
+
+    @rtype: AVLNode
+    """
+    def select(self, i):
+        return self._read(self._tree.select, i)
+
+    """returns the number of keys in the given range, as AVLTree.count_range
+
+    @rtype: int
+    """
+    def count_range(self, lo=None, hi=None, inclusive=(True, True)):
+        return self._read(self._tree.count_range, lo, hi, inclusive)
+
+    """returns the combined values of the keys in the given range, as AVLTree.aggregate
+    """
+    def aggregate(self, lo=None, hi=None, inclusive=(True, True)):
+        return self._read(self._tree.aggregate, lo, hi, inclusive)
+
+    """returns an array representing dictionary
+
+    @rtype: list
+    @returns: a sorted list according to key of touples (key, value) representing the data structure
+    """
+    def avl_to_array(self):
+        return self._read(self._tree.avl_to_array)
+
+    """returns the node with the maximal key in the dictionary
+
+    @rtype: AVLNode
+    """
+    def max_node(self):
+        return self._read(self._tree.max_node)
+
+    """returns the number of items in dictionary
+
+    @rtype: int
+    """
+    def size(self):
+        return self._tree.size() # a single attribute read
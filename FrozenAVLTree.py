@@ -0,0 +1,296 @@
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+"""File layout: a header, then four int64 arrays of n (or n + 1) entries and the value bytes.
+The search keys are in Eytzinger (BFS) order: slot k holds the root of the implicit tree when
+k == 1 and the children of slot k in slots 2k and 2k + 1, so a search reads slot after slot
+towards the front of the array instead of jumping across it."""
+_FILE_MAGIC = b'AVLF'
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sHBBQ') # magic, version, value encoding, byte order, item count
+_STR_VALUES, _BYTES_VALUES, _PICKLE_VALUES = 0, 1, 2
+_LITTLE_ENDIAN, _BIG_ENDIAN = 0, 1
+
+
+def _eytzinger_order(n):
+    """Returns the sorted index stored in each Eytzinger slot 1..n (at position slot - 1),
+    walking the implicit tree in order without recursion - O(n)."""
+    order = array('q', bytes(8 * n))
+    i, slot, stack = 0, 1, []
+    while stack or slot <= n:
+        if slot <= n:
+            stack.append(slot)
+            slot *= 2
+        else:
+            slot = stack.pop()
+            order[slot - 1] = i
+            i += 1
+            slot = 2 * slot + 1
+    return order
+
+
+"""
+A read-only AVL dictionary over int64 keys, served straight from a memory-mapped file written
+by freeze. Opening it reads nothing but the header, and processes mapping the same file share
+one copy in the page cache.
+
+Like ArrayAVLTree, nodes are ints: the position of an item in key order, read with
+get_key/get_value. Values are decoded when they are read.
+"""
+
+class FrozenAVLTree(object):
+
+    """opens a file written by freeze, in O(1)
+
+    @type path: str
+    @param path: a file written by FrozenAVLTree.freeze
+    @raises ValueError: if the file was not written by freeze or on a machine of the other byte order
+    """
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        try:
+            self._open_views()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open_views(self):
+        if len(self._map) < _FILE_HEADER.size:
+            raise ValueError("not a FrozenAVLTree file")
+        magic, version, encoding, byte_order, n = _FILE_HEADER.unpack_from(self._map)
+        if magic != _FILE_MAGIC:
+            raise ValueError("not a FrozenAVLTree file")
+        if version != _FILE_VERSION:
+            raise ValueError("unsupported FrozenAVLTree file version %d" % version)
+        if byte_order != (_LITTLE_ENDIAN if sys.byteorder == 'little' else _BIG_ENDIAN):
+            raise ValueError("FrozenAVLTree file was written with the other byte order")
+        self._n = n
+        self._encoding = encoding
+
+        view = memoryview(self._map)
+        self._views = [view]
+        offset = _FILE_HEADER.size
+        arrays = []
+        for length in (n, n, n, n + 1): # search keys, their ranks, sorted keys, value offsets
+            arrays.append(view[offset:offset + 8 * length].cast('q'))
+            offset += 8 * length
+        self._views.extend(arrays)
+        self._search_keys, self._search_ranks, self._keys, self._value_offsets = arrays
+        self._values = view[offset:]
+        self._views.append(self._values)
+
+    """writes tree to path in the layout FrozenAVLTree reads, in O(n)
+
+    @type tree: AVLTree
+    @pre: the keys of tree are ints in the int64 range
+    @param tree: the dictionary to freeze; str, bytes or (otherwise) picklable values
+    @type path: str
+    @param path: the file to create or overwrite
+    @rtype: FrozenAVLTree
+    @returns: the frozen dictionary, opened from path
+    @raises TypeError: if a key is not an int
+    """
+    @classmethod
+    def freeze(cls, tree, path):
+        keys, values = [], []
+        for key, value in tree.items(): # O(n)
+            if type(key) is not int:
+                raise TypeError("FrozenAVLTree keys must be ints, got %r" % (key,))
+            keys.append(key)
+            values.append(value)
+        n = len(keys)
+
+        if all(type(value) is str for value in values):
+            encoding, encoded = _STR_VALUES, [value.encode('utf-8') for value in values]
+        elif all(type(value) is bytes for value in values):
+            encoding, encoded = _BYTES_VALUES, values
+        else:
+            encoding, encoded = _PICKLE_VALUES, [pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                                                 for value in values]
+        value_offsets = array('q', [0])
+        for data in encoded:
+            value_offsets.append(value_offsets[-1] + len(data))
+
+        sorted_keys = array('q', keys)
+        search_ranks = _eytzinger_order(n)
+        search_keys = array('q', (keys[i] for i in search_ranks))
+        byte_order = _LITTLE_ENDIAN if sys.byteorder == 'little' else _BIG_ENDIAN
+
+        with open(path, 'wb') as file:
+            file.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, encoding, byte_order, n))
+            for column in (search_keys, search_ranks, sorted_keys, value_offsets):
+                column.tofile(file)
+            for data in encoded:
+                file.write(data)
+        return cls(path)
+
+    """releases the mapping; nothing may be read from self afterwards
+    """
+    def close(self):
+        for view in reversed(getattr(self, '_views', [])):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _lower_bound(self, key):
+        """Returns (the number of keys smaller than key, slots read) with an Eytzinger descent."""
+        search_keys, n = self._search_keys, self._n
+        slot, probes = 1, 0
+        while slot <= n: # O(log n)
+            slot = 2 * slot + (search_keys[slot - 1] < key)
+            probes += 1
+        slot >>= ((~slot) & (slot + 1)).bit_length() # undo the right turns after the last left turn
+        return (self._search_ranks[slot - 1] if slot else n), probes
+
+    """returns the key of a node
+
+    @type node: int
+    @rtype: int
+    """
+    def get_key(self, node):
+        return self._keys[node]
+
+    """returns the value of a node, decoding it from the mapping
+
+    @type node: int
+    """
+    def get_value(self, node):
+        data = self._values[self._value_offsets[node]:self._value_offsets[node + 1]]
+        if self._encoding == _STR_VALUES:
+            return str(data, 'utf-8')
+        if self._encoding == _BYTES_VALUES:
+            return bytes(data)
+        return pickle.loads(data)
+
+    """searches for a node in the dictionary corresponding to the key
+
+    @type key: int
+    @param key: a key to be searched
+    @rtype: (int,int)
+    @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+    and e is the number of key slots read
+    """
+    def search(self, key):
+        if self._n == 0:
+            return None, -1
+        search_keys, n = self._search_keys, self._n
+        slot, edges = 1, 0
+        while slot <= n: # O(log n)
+            edges += 1
+            found = search_keys[slot - 1]
+            if found == key:
+                return self._search_ranks[slot - 1], edges
+            slot = 2 * slot + (found < key)
+        return None, edges + 1
+
+    """returns the number of keys in the dictionary smaller than key, in O(log n)
+
+    @type key: int
+    @rtype: int
+    """
+    def rank(self, key):
+        return self._lower_bound(key)[0]
+
+    """returns the node with the i-th smallest key
+
+    @type i: int
+    @param i: a 0-based index into the keys in ascending order; negative values count from the end
+    @rtype: int
+    @returns: the node, None if i is out of range
+    """
+    def select(self, i):
+        if i < 0:
+            i += self._n
+        return i if 0 <= i < self._n else None
+
+    def _range(self, lo, hi, inclusive):
+        """Returns the node range [start, stop) of the keys within the bounds - O(log n)."""
+        lo_inclusive, hi_inclusive = inclusive
+        start = 0 if lo is None else (bisect_left if lo_inclusive else bisect_right)(self._keys, lo)
+        stop = self._n if hi is None else (bisect_right if hi_inclusive else bisect_left)(self._keys, hi)
+        return start, max(start, stop)
+
+    """iterates over the items of the dictionary in key order, optionally within a range
+
+    @type lo: int
+    @param lo: lower bound on the keys, None for no bound
+    @type hi: int
+    @param hi: upper bound on the keys, None for no bound
+    @type inclusive: (bool, bool)
+    @param inclusive: whether lo and hi themselves are included
+    @type reverse: bool
+    @param reverse: iterate in descending order
+    @type limit: int
+    @param limit: the maximal number of items, None for all
+    @rtype: generator
+    """
+    def items(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        start, stop = self._range(lo, hi, inclusive)
+        nodes = range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+        if limit is not None:
+            nodes = nodes[:limit]
+        for node in nodes:
+            yield self._keys[node], self.get_value(node)
+
+    """iterates over the keys of the dictionary in key order, with the arguments of items
+
+    @rtype: generator
+    """
+    def keys(self, lo=None, hi=None, inclusive=(True, True), reverse=False, limit=None):
+        start, stop = self._range(lo, hi, inclusive)
+        nodes = range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+        if limit is not None:
+            nodes = nodes[:limit]
+        for node in nodes:
+            yield self._keys[node]
+
+    """returns the number of keys in the given range, in O(log n)
+
+    @rtype: int
+    """
+    def count_range(self, lo=None, hi=None, inclusive=(True, True)):
+        start, stop = self._range(lo, hi, inclusive)
+        return stop - start
+
+    def __iter__(self):
+        return self.keys()
+
+    """returns an array representing dictionary
+
+    @rtype: list
+    @returns: a sorted list according to key of touples (key, value) representing the data structure
+    """
+    def avl_to_array(self):
+        return list(self.items())
+
+    """returns the node with the maximal key in the dictionary
+
+    @rtype: int
+    @returns: the maximal node, None if the dictionary is empty
+    """
+    def max_node(self):
+        return self._n - 1 if self._n else None
+
+    """returns the number of items in dictionary
+
+    @rtype: int
+    """
+    def size(self):
+        return self._n
@@ -0,0 +1,296 @@
+"""Empty subtrees are None. A node is never modified once a tree can reach it, so versions
+share every node off the paths they changed and need no parent pointers."""
+
+
+class PersistentAVLNode(object):
+    """An immutable node of a PersistentAVLTree, with its subtree height and size.
+
+    @type key: int
+    @param key: key of your node
+    @type value: string
+    @param value: data of your node
+    """
+    __slots__ = ('key', 'value', 'left', 'right', 'height', 'size')
+
+    def __init__(self, key, value, left=None, right=None):
+        self.key = key
+        self.value = value
+        self.left = left
+        self.right = right
+        self.height = 1 + max(_height(left), _height(right))
+        self.size = 1 + _size(left) + _size(right)
+
+
+def _height(node):
+    return node.height if node is not None else -1
+
+def _size(node):
+    return node.size if node is not None else 0
+
+def _balance(key, value, left, right):
+    """Returns a new node over left < key < right, whose heights differ by at most 2,
+    rotating when they differ by 2. Allocates O(1) nodes."""
+    difference = _height(left) - _height(right)
+    if difference > 1: # left heavy
+        if _height(left.left) < _height(left.right): # double rotation
+            middle = left.right
+            return PersistentAVLNode(middle.key, middle.value,
+                                     PersistentAVLNode(left.key, left.value, left.left, middle.left),
+                                     PersistentAVLNode(key, value, middle.right, right))
+        return PersistentAVLNode(left.key, left.value, left.left,
+                                 PersistentAVLNode(key, value, left.right, right))
+    if difference < -1: # right heavy
+        if _height(right.right) < _height(right.left): # double rotation
+            middle = right.left
+            return PersistentAVLNode(middle.key, middle.value,
+                                     PersistentAVLNode(key, value, left, middle.left),
+                                     PersistentAVLNode(right.key, right.value, middle.right, right.right))
+        return PersistentAVLNode(right.key, right.value,
+                                 PersistentAVLNode(key, value, left, right.left), right.right)
+    return PersistentAVLNode(key, value, left, right)
+
+def _insert(node, key, value):
+    """Returns a copy of the subtree node holding key, copying the search path - O(log n)."""
+    if node is None:
+        return PersistentAVLNode(key, value)
+    if key < node.key:
+        return _balance(node.key, node.value, _insert(node.left, key, value), node.right)
+    if node.key < key:
+        return _balance(node.key, node.value, node.left, _insert(node.right, key, value))
+    return PersistentAVLNode(key, value, node.left, node.right) # replace the value
+
+def _delete_min(node):
+    """Returns (a copy of the subtree node without its minimum, the minimum node) - O(log n)."""
+    if node.left is None:
+        return node.right, node
+    left, minimum = _delete_min(node.left)
+    return _balance(node.key, node.value, left, node.right), minimum
+
+def _delete(node, key):
+    """Returns a copy of the subtree node without key, copying the search path - O(log n)."""
+    if node is None:
+        return None
+    if key < node.key:
+        return _balance(node.key, node.value, _delete(node.left, key), node.right)
+    if node.key < key:
+        return _balance(node.key, node.value, node.left, _delete(node.right, key))
+    if node.left is None:
+        return node.right
+    if node.right is None:
+        return node.left
+    right, successor = _delete_min(node.right)
+    return _balance(successor.key, successor.value, node.left, right)
+
+def _join(left, key, value, right):
+    """Joins the subtrees left < key < right, copying the spine of the taller one down to
+    the height of the shorter one - O(|left height - right height| + 1)."""
+    if _height(left) > _height(right) + 1:
+        return _balance(left.key, left.value, left.left, _join(left.right, key, value, right))
+    if _height(right) > _height(left) + 1:
+        return _balance(right.key, right.value, _join(left, key, value, right.left), right.right)
+    return PersistentAVLNode(key, value, left, right)
+
+def _split(node, key):
+    """Splits the subtree node around key in O(log n), returns (left, node holding key or None, right)."""
+    if node is None:
+        return None, None, None
+    if key < node.key:
+        left, found, right = _split(node.left, key)
+        return left, found, _join(right, node.key, node.value, node.right)
+    if node.key < key:
+        left, found, right = _split(node.right, key)
+        return _join(node.left, node.key, node.value, left), found, right
+    return node.left, node, node.right
+
+def _build(items, lo, hi):
+    """Builds a perfectly balanced subtree from the sorted items[lo:hi] - O(hi - lo)."""
+    if lo == hi:
+        return None
+    mid = (lo + hi) // 2
+    key, value = items[mid]
+    return PersistentAVLNode(key, value, _build(items, lo, mid), _build(items, mid + 1, hi))
+
+
+"""
+A class implementing a persistent AVL tree. Updates copy only the nodes on the paths they
+change, so snapshot() is O(1) and a snapshot stays valid while the tree keeps changing.
+Versions nothing refers to any more are reclaimed by reference counting.
+"""
+
+class PersistentAVLTree(object):
+
+    def __init__(self):
+        self.root = None
+        self._frozen = False
+
+    def _set_root(self, root):
+        if self._frozen:
+            raise TypeError("a snapshot of a PersistentAVLTree cannot be modified")
+        self.root = root # a single reference assignment, so readers see the old or the new version
+
+    def _view(self, root):
+        tree = PersistentAVLTree()
+        tree.root = root
+        return tree
+
+    """builds a perfectly balanced tree from sorted items in O(n)
+
+    @type items: iterable
+    @pre: items yields (key, value) pairs with strictly increasing keys
+    @param items: the items of the new dictionary
+    @rtype: PersistentAVLTree
+    @returns: a new tree holding items
+    """
+    @classmethod
+    def from_sorted(cls, items):
+        items = list(items)
+        tree = cls()
+        tree.root = _build(items, 0, len(items))
+        return tree
+
+    """returns a read-only view of the current version of the dictionary, in O(1)
+
+    The view never changes, whatever is later done to self, and can be read from other threads
+    without locking. Modifying it raises TypeError.
+
+    @rtype: PersistentAVLTree
+    """
+    def snapshot(self):
+        view = self._view(self.root)
+        view._frozen = True
+        return view
+
+    """returns whether self is a read-only snapshot
+
+    @rtype: bool
+    """
+    def is_snapshot(self):
+        return self._frozen
+
+    """searches for a node in the dictionary corresponding to the key
+
+    @type key: int
+    @param key: a key to be searched
+    @rtype: (PersistentAVLNode,int)
+    @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+    and e is the number of edges on the path between the root and ending node+1.
+    """
+    def search(self, key):
+        node = self.root
+        if node is None: # Empty tree
+            return None, -1
+        edges = 0
+        while node is not None: # O(log n)
+            edges += 1
+            if node.key == key:
+                return node, edges
+            node = node.right if node.key < key else node.left
+        return None, edges + 1 # counting the virtual node, as AVLTree does
+
+    """inserts an item into the dictionary, replacing the value if key is already in it
+
+    Copies the O(log n) nodes on the search path; other versions are not affected.
+
+    @type key: int
+    @param key: key of item that is to be inserted to self
+    @type val: string
+    @param val: the value of the item
+    """
+    def insert(self, key, val):
+        self._set_root(_insert(self.root, key, val))
+
+    """deletes node from the dictionary, copying the O(log n) nodes on its path
+
+    @type node: PersistentAVLNode
+    @pre: node is a real pointer to a node in self
+    """
+    def delete(self, node):
+        self._set_root(_delete(self.root, node.key))
+
+    """joins self with item and another PersistentAVLTree, in O(|height difference| + 1)
+
+    tree2 is not changed, its nodes are shared with self.
+
+    @type tree2: PersistentAVLTree
+    @param tree2: a dictionary to be joined with self
+    @type key: int
+    @param key: the key separting self and tree2
+    @type val: string
+    @param val: the value corresponding to key
+    @pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+    or the opposite way
+    """
+    def join(self, tree2, key, val):
+        if (self.root is not None and self.root.key < key) or \
+                (tree2.root is not None and tree2.root.key > key): # self holds the smaller keys
+            self._set_root(_join(self.root, key, val, tree2.root))
+        else:
+            self._set_root(_join(tree2.root, key, val, self.root))
+
+    """splits the dictionary at a given node in O(log n), self is not changed
+
+    @type node: PersistentAVLNode
+    @pre: node is in self
+    @param node: the node in the dictionary to be used for the split
+    @rtype: (PersistentAVLTree, PersistentAVLTree)
+    @returns: a tuple (left, right), where left holds the keys smaller than node.key
+    and right holds the keys larger than node.key.
+    """
+    def split(self, node):
+        left, _, right = _split(self.root, node.key)
+        return self._view(left), self._view(right)
+
+    def _iter_nodes(self):
+        """Yields the nodes in key order, keeping an O(log n) stack."""
+        stack, node = [], self.root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node
+                node = node.right
+
+    """iterates over the keys of the dictionary in ascending order
+
+    @rtype: generator
+    """
+    def __iter__(self):
+        for node in self._iter_nodes():
+            yield node.key
+
+    """returns an array representing dictionary
+
+    @rtype: list
+    @returns: a sorted list according to key of touples (key, value) representing the data structure
+    """
+    def avl_to_array(self):
+        return [(node.key, node.value) for node in self._iter_nodes()]
+
+    """returns the node with the maximal key in the dictionary, in O(log n)
+
+    @rtype: PersistentAVLNode
+    @returns: the maximal node, None if the dictionary is empty
+    """
+    def max_node(self):
+        node = self.root
+        while node is not None and node.right is not None:
+            node = node.right
+        return node
+
+    """returns the number of items in dictionary
+
+    @rtype: int
+    @returns: the number of items in dictionary
+    """
+    def size(self):
+        return _size(self.root)
+
+    """returns the root of the tree representing the dictionary
+
+    @rtype: PersistentAVLNode
+    @returns: the root, None if the dictionary is empty
+    """
+    def get_root(self):
+        return self.root
@@ -0,0 +1,453 @@
+"""Benchmark suite for AVLTree.
+
+Times the core operations on seeded workloads over a range of sizes, writes the results as
+JSON and compares them against a saved baseline run:
+
+    python benchmark.py --max-size 100000 --output results.json
+    python benchmark.py --baseline results.json --threshold 0.1
+
+The comparisons listed in EXPERIMENTS (e.g. the cost of enable_stats) run only when named:
+
+    python benchmark.py --operations insert,insert_counted,insert_timed
+
+Every case is repeated and reported by its median, so single slow runs do not count as
+regressions. Memory is measured in a separate run under tracemalloc, which slows the
+interpreter down and would distort the timings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from bisect import bisect_right
+from itertools import accumulate
+
+import ArrayAVLTree as array_avl
+import AsyncAVLTree as async_avl
+import AVLTree as avl
+import ConcurrentAVLTree as concurrent_avl
+import FrozenAVLTree as frozen_avl
+
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+WORKLOADS = ["sorted", "reversed", "random", "random_swap", "zipfian"]
+OPERATIONS = ["insert", "finger_insert", "search", "finger_search", "delete", "join", "split",
+              "avl_to_array"]
+
+"""Comparisons against the core operations, run only when named in --operations"""
+EXPERIMENTS = ["insert_counted", "insert_timed", "delete_counted", "duplicates", "duplicate_pairs",
+               "key_func", "tuple_key", "array_insert", "array_search", "indexed_insert", "indexed_search",
+               "search_many", "union", "union_rebuild", "save", "load", "frozen_open", "frozen_search",
+               "concurrent_locked", "concurrent_optimistic", "async_unbatched", "async_batched"]
+
+"""join and split are timed on this many nodes per run, each split is joined back untimed"""
+SPLITS_PER_RUN = 1000
+
+"""duplicates and duplicate_pairs insert the workload keys modulo this many distinct keys"""
+DISTINCT_KEYS = 100
+
+"""union and union_rebuild merge this many random keys into the tree"""
+UNION_KEYS = 100
+
+"""The concurrent cases split their operations over this many threads, this share of them searches"""
+THREADS = 4
+READ_RATIO = 0.9
+
+"""The async cases split their writes over this many coroutines"""
+WRITERS = 100
+
+"""Exponent of the Zipfian workload: the i-th most popular key is drawn with weight 1/i^s"""
+ZIPF_EXPONENT = 1.1
+
+
+class Record(object):
+    """A composite record ordered by (last, first), the key of the key_func and tuple_key cases."""
+    __slots__ = ("last", "first")
+
+    def __init__(self, last, first):
+        self.last = last
+        self.first = first
+
+    def sort_key(self):
+        return self.last, self.first
+
+
+def workload(name, n, rng):
+    """Returns the keys 0..n-1 in the order of the named workload.
+
+    zipfian orders keys by their first appearance in n draws from a Zipf distribution over a
+    random ranking of the keys (popular keys come first), followed by the keys never drawn.
+    """
+    keys = list(range(n))
+    if name == "sorted":
+        return keys
+    if name == "reversed":
+        return keys[::-1]
+    if name == "random":
+        rng.shuffle(keys)
+        return keys
+    if name == "random_swap":
+        for i in range(n - 1): # the random_swap of test.py, with a seeded generator
+            if rng.random() < 0.5:
+                keys[i], keys[i + 1] = keys[i + 1], keys[i]
+        return keys
+    if name == "zipfian":
+        return list(dict.fromkeys(zipfian_draws(n, n, rng) + keys))
+    raise ValueError("unknown workload %r" % name)
+
+
+def zipfian_draws(n, count, rng):
+    """Draws count keys from 0..n-1 with Zipfian popularity, keys ranked in random order."""
+    ranking = list(range(n))
+    rng.shuffle(ranking)
+    weights = list(accumulate(1 / (i + 1) ** ZIPF_EXPONENT for i in range(n)))
+    total = weights[-1]
+    return [ranking[min(n - 1, bisect_right(weights, rng.random() * total))] for _ in range(count)]
+
+
+def queries(name, n, rng):
+    """Returns the keys searched or deleted by the named workload; zipfian repeats popular keys."""
+    if name == "zipfian":
+        return zipfian_draws(n, n, rng)
+    return workload(name, n, rng)
+
+
+def prepare(operation, name, n, rng):
+    """Builds the untimed inputs of one run, returns a function doing the timed part and its op count.
+
+    insert_counted and insert_timed are insert on a tree with enable_stats() and
+    enable_stats(timing=True), to be read against insert as the cost of the statistics.
+    duplicates inserts the keys modulo DISTINCT_KEYS into a tree with duplicates='count';
+    duplicate_pairs inserts them into a plain tree as unique (key, sequence number) pairs.
+    key_func inserts and then searches Records in a tree with key=Record.sort_key; tuple_key
+    does the same in a plain tree, building the (last, first) tuple for every call. key_func
+    pays for one call of the key function per operation, as the tree never calls it per node.
+
+    delete_counted is delete on a tree with enable_stats(); measure records its rotations and
+    height updates per delete. array_* and indexed_* are insert and search on ArrayAVLTree and
+    on AVLTree(index=True), search_many searches all the keys in one call. union merges
+    UNION_KEYS random keys into the tree, union_rebuild does the same by dumping both trees and
+    rebuilding. save, load, frozen_open and frozen_search compare the AVLTree file with a
+    FrozenAVLTree mapping of the same tree. The concurrent_* cases run searches, inserts and
+    deletes of random keys on ConcurrentAVLTree from THREADS threads; async_unbatched and
+    async_batched run inserts and deletes from WRITERS coroutines on an AsyncAVLTree flushing
+    every write or batches of up to 64.
+    """
+    if operation in ("insert", "finger_insert", "insert_counted", "insert_timed"):
+        keys = workload(name, n, rng)
+        def run():
+            tree = avl.AVLTree()
+            if operation != "finger_insert":
+                if operation != "insert":
+                    tree.enable_stats(timing=(operation == "insert_timed"))
+                for key in keys:
+                    tree.insert(key, key)
+            else:
+                for key in keys:
+                    tree.finger_insert(key, key, tree.last_accessed())
+            return tree
+        return run, len(keys)
+
+    if operation in ("duplicates", "duplicate_pairs"):
+        keys = [key % DISTINCT_KEYS for key in workload(name, n, rng)]
+        def run():
+            if operation == "duplicates":
+                tree = avl.AVLTree(duplicates="count")
+                for key in keys:
+                    tree.insert(key, key)
+            else:
+                tree = avl.AVLTree()
+                for seq, key in enumerate(keys):
+                    tree.insert((key, seq), key)
+            return tree
+        return run, len(keys)
+
+    if operation in ("key_func", "tuple_key"):
+        records = [Record(key % 1000, key) for key in workload(name, n, rng)]
+        def run():
+            if operation == "key_func":
+                tree = avl.AVLTree(key=Record.sort_key)
+                for record in records:
+                    tree.insert(record, record.first)
+                for record in records:
+                    tree.search(record)
+            else:
+                tree = avl.AVLTree()
+                for record in records:
+                    tree.insert((record.last, record.first), record.first)
+                for record in records:
+                    tree.search((record.last, record.first))
+            return tree
+        return run, 2 * len(records)
+
+    if operation in ("array_insert", "array_search"):
+        tree = array_avl.ArrayAVLTree()
+        if operation == "array_insert":
+            keys = workload(name, n, rng)
+        else:
+            for key in range(n): # ArrayAVLTree has no from_sorted
+                tree.insert(key, key)
+            keys = queries(name, n, rng)
+        def run():
+            if operation == "array_insert":
+                for key in keys:
+                    tree.insert(key, key)
+            else:
+                for key in keys:
+                    tree.search(key)
+            return tree
+        return run, len(keys)
+
+    if operation == "indexed_insert":
+        keys = workload(name, n, rng)
+        def run():
+            tree = avl.AVLTree(index=True)
+            for key in keys:
+                tree.insert(key, key)
+            return tree
+        return run, len(keys)
+
+    if operation in ("union", "union_rebuild"):
+        tree = avl.AVLTree.from_sorted((key, key) for key in range(0, 2 * n, 2))
+        small = avl.AVLTree.from_sorted((key, -key) for key in sorted(rng.sample(range(2 * n), UNION_KEYS)))
+        def run():
+            if operation == "union":
+                tree.union(small)
+                return tree
+            merged = dict(tree.avl_to_array())
+            merged.update(small.avl_to_array())
+            return avl.AVLTree.from_sorted(sorted(merged.items()))
+        return run, UNION_KEYS
+
+    if operation in ("concurrent_locked", "concurrent_optimistic"):
+        tree = concurrent_avl.ConcurrentAVLTree(optimistic=(operation == "concurrent_optimistic"))
+        tree.insert_many((key, key) for key in range(0, 2 * n, 2))
+        plans = [[(rng.randrange(2 * n), rng.random() < READ_RATIO) for _ in range(n // THREADS)]
+                 for _ in range(THREADS)]
+        def worker(plan):
+            for key, read in plan:
+                if read:
+                    tree.search(key)
+                elif key % 2:
+                    tree.insert_many([(key, key)])
+                else:
+                    tree.delete_many([key])
+        def run():
+            threads = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return tree
+        return run, THREADS * (n // THREADS)
+
+    if operation in ("async_unbatched", "async_batched"):
+        if operation == "async_unbatched":
+            tree = async_avl.AsyncAVLTree(max_batch=1, max_delay=0)
+        else:
+            tree = async_avl.AsyncAVLTree(max_batch=64, max_delay=0.001)
+        tree._tree.insert_many((key, key) for key in range(0, 2 * n, 2)) # untimed, without queueing
+        plans = [[rng.randrange(2 * n) for _ in range(n // WRITERS)] for _ in range(WRITERS)]
+        async def writer(plan):
+            for key in plan:
+                if key % 2:
+                    await tree.insert(key, key)
+                else:
+                    await tree.delete(key)
+        async def writers():
+            await asyncio.gather(*(writer(plan) for plan in plans))
+        def run():
+            asyncio.run(writers())
+            return tree
+        return run, WRITERS * (n // WRITERS)
+
+    tree = avl.AVLTree.from_sorted(((key, key) for key in range(n)), index=(operation == "indexed_search"))
+    if operation in ("save", "load", "frozen_open", "frozen_search"):
+        directory = tempfile.TemporaryDirectory() # removed when the run is garbage collected
+        path = os.path.join(directory.name, "tree")
+        if operation != "save":
+            tree.save(path)
+        if operation in ("frozen_open", "frozen_search"):
+            frozen_avl.FrozenAVLTree.freeze(tree, path + ".frozen").close()
+        keys = queries(name, n, rng)
+        def run():
+            if operation == "save":
+                tree.save(path)
+                return directory
+            if operation == "load":
+                loaded = avl.AVLTree.load(path)
+                return directory, loaded
+            mapped = frozen_avl.FrozenAVLTree(path + ".frozen")
+            if operation == "frozen_search":
+                for key in keys:
+                    mapped.search(key)
+            mapped.close()
+            return directory
+        return run, n if operation != "frozen_search" else len(keys)
+
+    if operation == "delete_counted":
+        tree.enable_stats()
+    if operation in ("search", "finger_search", "indexed_search", "search_many"):
+        keys = queries(name, n, rng)
+        def run():
+            if operation in ("search", "indexed_search"):
+                for key in keys:
+                    tree.search(key)
+            elif operation == "search_many":
+                tree.search_many(keys)
+            else:
+                for key in keys:
+                    tree.finger_search(key, tree.last_accessed())
+            return tree
+        return run, len(keys)
+
+    if operation in ("delete", "delete_counted"):
+        nodes = [tree.search(key)[0] for key in dict.fromkeys(queries(name, n, rng))]
+        def run():
+            for node in nodes:
+                tree.delete(node)
+            return tree
+        return run, len(nodes)
+
+    if operation in ("join", "split"):
+        keys = queries(name, n, rng)[:SPLITS_PER_RUN]
+        def run():
+            current, elapsed = tree, 0.0
+            for key in keys:
+                node = current.select(key) # key == rank
+                start = time.perf_counter()
+                left, right = current.split(node)
+                if operation == "split":
+                    elapsed += time.perf_counter() - start
+                start = time.perf_counter()
+                left.join(right, node.key, node.value)
+                if operation == "join":
+                    elapsed += time.perf_counter() - start
+                current = left
+            return elapsed
+        return run, len(keys)
+
+    if operation == "avl_to_array":
+        return tree.avl_to_array, n
+    raise ValueError("unknown operation %r" % operation)
+
+
+def measure(operation, name, n, repeat, seed, memory):
+    """Runs one case repeat times, returns its result record."""
+    times, stats = [], None
+    for i in range(repeat):
+        run, ops = prepare(operation, name, n, _rng(seed, operation, name, n, i))
+        start = time.perf_counter()
+        result = run()
+        total = time.perf_counter() - start
+        times.append(result if operation in ("join", "split") else total)
+        if i == 0 and isinstance(result, avl.AVLTree):
+            stats = result.stats()
+
+    record = {
+        "operation": operation,
+        "workload": name,
+        "size": n,
+        "ops": ops,
+        "times": times,
+        "median": statistics.median(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "ns_per_op": statistics.median(times) / max(ops, 1) * 1e9,
+    }
+    if stats is not None: # the counters of the first run, which depend only on the seed
+        record["counts_per_op"] = {event: count / max(ops, 1) for event, count in sorted(stats.counts.items())
+                                   if event in ("rotations", "height_updates", "min_max_walks")}
+    if memory:
+        run, _ = prepare(operation, name, n, _rng(seed, operation, name, n, 0))
+        tracemalloc.start()
+        result = run()
+        record["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del result
+    return record
+
+
+def _rng(seed, *case):
+    """A generator seeded by the run seed and the case, so every case is reproducible alone."""
+    return random.Random("%s:%s" % (seed, ":".join(map(str, case))))
+
+
+def compare(results, baseline, threshold):
+    """Returns the records slower than their baseline record by more than threshold,
+    as (record, baseline ns_per_op) pairs."""
+    reference = {(r["operation"], r["workload"], r["size"]): r["ns_per_op"] for r in baseline["results"]}
+    regressions = []
+    for record in results:
+        base = reference.get((record["operation"], record["workload"], record["size"]))
+        if base is not None and record["ns_per_op"] > base * (1 + threshold):
+            regressions.append((record, base))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help="comma-separated operations of %s" % (OPERATIONS + EXPERIMENTS))
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="comma-separated workloads")
+    parser.add_argument("--max-size", type=int, default=10 ** 5, help="largest size of %s" % SIZES)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="also record the peak memory allocated by the timed part of each case")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown over the baseline that counts as a regression")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.operations.split(",") if name not in OPERATIONS + EXPERIMENTS]
+    if unknown:
+        parser.error("unknown operations %s" % ",".join(unknown))
+
+    results = []
+    for n in (size for size in SIZES if size <= args.max_size):
+        for operation in args.operations.split(","):
+            for name in args.workloads.split(","):
+                record = measure(operation, name, n, args.repeat, args.seed, args.memory)
+                results.append(record)
+                line = "%-21s %-12s %9d  %10.1f ns/op  +- %5.1f%%" % (
+                    operation, name, n, record["ns_per_op"],
+                    100 * record["stdev"] / record["median"] if record["median"] else 0)
+                if "peak_bytes" in record:
+                    line += "  %8.1f B/key" % (record["peak_bytes"] / n)
+                print(line, flush=True)
+
+    output = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(output, file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for record, base in regressions:
+            print("REGRESSION %s %s %d: %.1f -> %.1f ns/op" % (
+                record["operation"], record["workload"], record["size"], base, record["ns_per_op"]))
+        if regressions:
+            return 1
+        print("no regressions over %.0f%%" % (100 * args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
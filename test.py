@@ -1,4 +1,10 @@
+"""Experiments measuring promotes, inversions, search edges and memory of AVLTree.
+Timings, including the comparisons with the other engines and front ends, are seeded cases
+of benchmark.py.
+"""
 import random
+from bisect import bisect_right, insort
+import tracemalloc
 import AVLTree as avl
 
 def create_random_array(n):
@@ -15,7 +21,7 @@ def random_swap(array):
     return array
 
 def count_inversions_direct(array):
-    """Counts the number of inversions in the array directly (O(n^2))."""
+    """Counts the number of inversions in the array directly (O(n^2)), the reference for count_inversions."""
     inversions = 0
     for i in range(len(array)):
         for j in range(i + 1, len(array)):
@@ -23,6 +29,41 @@ def count_inversions_direct(array):
                 inversions += 1
     return inversions
 
+def count_inversions(array):
+    """Counts the number of inversions in the array by a bottom-up merge sort (O(n log n))."""
+    inversions = 0
+
+    # Sort short runs by insertion, counting the earlier items larger than each item
+    runs = []
+    for start in range(0, len(array), 32):
+        run = []
+        for i, item in enumerate(array[start:start + 32]):
+            inversions += i - bisect_right(run, item)
+            insort(run, item)
+        runs.append(run)
+
+    # Merge pairs of runs in linear time; an item of the right run is inverted with
+    # every item of the left run not yet merged when it is taken (equal items are not)
+    while len(runs) > 1:
+        merged = []
+        for i in range(0, len(runs) - 1, 2):
+            left, right = runs[i], runs[i + 1]
+            run = []
+            k = 0
+            for item in right:
+                while k < len(left) and left[k] <= item:
+                    run.append(left[k])
+                    k += 1
+                inversions += len(left) - k
+                run.append(item)
+            run.extend(left[k:])
+            merged.append(run)
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+
+    return inversions
+
 def count_search_edges(tree, array):
     """Counts the total edges traversed during searches for all keys in the tree."""
     total_edges = 0
@@ -88,7 +129,7 @@ def test_inversions():
         "random_swap": []
     }
 
-    for i in range(1, 6):  # עד 5 = i
+    for i in range(1, 11):  # עד 10 = i
         n = 111 * (2**i)  # Array size
         arr1 = [j for j in range(n)]  # ממוין (sorted)
         arr2 = arr1[::-1]             # ממוין הפוך (reverse sorted)
@@ -103,12 +144,12 @@ def test_inversions():
             arr3 = create_random_array(n)  # יצירת מערך אקראי
             arr4 = random_swap(arr1.copy())  # יצירת מערך ממוין עם החלפות אקראיות
  
-            random_inversions.append(count_inversions_direct(arr3))
-            random_swap_inversions.append(count_inversions_direct(arr4))
+            random_inversions.append(count_inversions(arr3))
+            random_swap_inversions.append(count_inversions(arr4))
 
         # Count inversions for sorted and reverse sorted arrays (constant results)
-        sorted_inversions = count_inversions_direct(arr1)  # תמיד 0
-        reverse_sorted_inversions = count_inversions_direct(arr2)  # תמיד מקסימלי
+        sorted_inversions = count_inversions(arr1)  # תמיד 0
+        reverse_sorted_inversions = count_inversions(arr2)  # תמיד מקסימלי
 
         # Calculate averages for random and random_swap arrays
         avg_random_inversions = sum(random_inversions) / len(random_inversions)
@@ -140,9 +181,9 @@ def test_search_edges():
 
         for test_type in results.keys():
             total_search_edges = []
-            total_edges = 0
 
             for _ in range(20):  # להריץ 20 פעמים עבור כל סוג מערך
+                total_edges = 0
                 # Generate arrays for this iteration
                 if test_type == "sorted":
                     arr = [j for j in range(n)]  # ממוין
@@ -156,10 +197,7 @@ def test_search_edges():
                 # Build the AVL tree and perform the search
                 tree = avl.AVLTree()
                 for var in arr:
-                    
                     _, edges, _ = tree.finger_insert(var, "var")
-                    if test_type == "sorted":
-                        print(edges)
                     total_edges += edges
 
                 total_search_edges.append(total_edges)
@@ -174,6 +212,28 @@ def test_search_edges():
         for n, avg_edges in results[test_type]:
             print(f"Array size: {n}, Avg edges per search: {avg_edges:.2f}")
 
+def test_memory():
+    """Measures the memory held by a tree, in bytes per key."""
+    results = []
+
+    for i in range(1, 11):
+        n = 111 * (2 ** i)
+        arr = create_random_array(n)
+
+        tracemalloc.start()
+        tree = avl.AVLTree()
+        for var in arr:
+            tree.insert(var, "var")
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append((n, used / n))
+
+    # Print results
+    print("\nMemory results:")
+    for n, bytes_per_key in results:
+        print(f"Array size: {n}, Bytes per key: {bytes_per_key:.1f}")
+
 if __name__ == "__main__":
     #test_inversions()
     # test_insertions()
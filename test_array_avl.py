@@ -0,0 +1,145 @@
+import random
+import unittest
+from AVLTree import AVLTree
+from ArrayAVLTree import ArrayAVLTree, VIRTUAL
+
+class TestArrayAVLTree(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an empty array-backed AVL tree before each test."""
+        self.tree = ArrayAVLTree()
+
+    def check_invariants(self, tree):
+        """Checks order, parent links, heights, sizes and balance of every node."""
+        pool = tree._pool
+        def check(node, parent):
+            if node == VIRTUAL:
+                return -1, 0
+            self.assertEqual(pool.parent[node], parent)
+            left_height, left_size = check(pool.left[node], node)
+            right_height, right_size = check(pool.right[node], node)
+            self.assertLessEqual(abs(left_height - right_height), 1)
+            self.assertEqual(pool.heights[node], 1 + max(left_height, right_height))
+            self.assertEqual(pool.sizes[node], 1 + left_size + right_size)
+            return pool.heights[node], pool.sizes[node]
+        check(tree.root, VIRTUAL)
+        keys = [key for key, _ in tree.avl_to_array()]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(tree.size(), len(keys))
+
+    def test_insert_and_search(self):
+        """Test insertion and search functionality."""
+        self.tree.insert(10, "A")
+        self.tree.insert(20, "B")
+        self.tree.insert(30, "C")
+
+        node, _ = self.tree.search(10)
+        self.assertEqual(self.tree.get_key(node), 10)
+        self.assertEqual(self.tree.get_value(node), "A")
+        self.assertIsNone(self.tree.search(40)[0])
+        self.assertEqual(self.tree.get_key(self.tree.finger_search(20)[0]), 20)
+        self.assertIsNone(self.tree.finger_search(25)[0])
+
+    def test_same_edges_and_promotes_as_avl_tree(self):
+        """Test insert and finger_insert report the same (e, h) as the pointer-based tree."""
+        random.seed(0)
+        tree = AVLTree()
+        for key in random.sample(range(10000), 2000):
+            self.assertEqual(self.tree.insert(key, "")[1:], tree.insert(key, "")[1:])
+        for key in range(10000, 10500):
+            self.assertEqual(self.tree.finger_insert(key, "")[1:], tree.finger_insert(key, "")[1:])
+        for key in random.sample(range(10500), 100):
+            self.assertEqual(self.tree.search(key)[1], tree.search(key)[1])
+        self.check_invariants(self.tree)
+
+    def test_random_inserts_and_deletes(self):
+        """Test random sequences of insertions and deletions against a dict."""
+        random.seed(1)
+        expected = {}
+        for _ in range(2000):
+            key = random.randrange(300)
+            if key in expected:
+                self.tree.delete(self.tree.search(key)[0])
+                del expected[key]
+            else:
+                self.tree.finger_insert(key, str(key))
+                expected[key] = str(key)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.avl_to_array(), sorted(expected.items()))
+        self.assertEqual(self.tree.get_key(self.tree.max_node()), max(expected))
+
+    def test_deleted_slots_are_reused(self):
+        """Test a delete followed by an insert does not grow the arrays."""
+        for key in range(100):
+            self.tree.insert(key, "")
+        self.tree.delete(self.tree.search(50)[0])
+        self.tree.insert(50, "")
+        self.assertEqual(len(self.tree._pool.keys), 100)
+
+    def test_split_and_join(self):
+        """Test split sizes and joining the halves back, also across pools."""
+        for key in range(1, 101):
+            self.tree.insert(key, str(key))
+
+        left_tree, right_tree = self.tree.split(self.tree.search(40)[0])
+        self.check_invariants(left_tree)
+        self.check_invariants(right_tree)
+        self.assertEqual(left_tree.size(), 39)
+        self.assertEqual(right_tree.size(), 60)
+        self.assertEqual(left_tree.get_key(left_tree.max_node()), 39)
+
+        right_tree.join(left_tree, 40, "40")
+        self.check_invariants(right_tree)
+        self.assertEqual(right_tree.avl_to_array(), [(key, str(key)) for key in range(1, 101)])
+
+        other = ArrayAVLTree()
+        other.insert(200, "200")
+        right_tree.join(other, 150, "150")
+        self.check_invariants(right_tree)
+        self.assertEqual(right_tree.size(), 102)
+        self.assertEqual(right_tree.get_key(right_tree.max_node()), 200)
+
+    def test_join_releases_the_adopted_pool(self):
+        """Test that joining a tree from another pool frees its slots there, keeping other trees intact."""
+        for key in range(100):
+            self.tree.insert(key, str(key))
+        other = ArrayAVLTree()
+        for key in range(200, 300):
+            other.insert(key, str(key))
+        low, high = other.split(other.search(250)[0]) # low and high share other's pool
+        pool = low._pool
+
+        self.tree.join(low, 150, "150")
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 151)
+        self.assertEqual(len(pool.free), 51) # low's 50 nodes and the split node
+        self.assertEqual(pool.values.count(None), 51)
+        self.check_invariants(high)
+        self.assertEqual(high.avl_to_array(), [(key, str(key)) for key in range(251, 300)])
+
+        self.tree.join(high, 250, "250") # the last nodes of the pool
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 201)
+        self.assertEqual((len(pool.keys), len(pool.values), len(pool.free)), (0, 0, 0))
+        high.insert(5, "5") # an empty tree can still use the cleared pool
+        self.check_invariants(high)
+        self.assertEqual(high.avl_to_array(), [(5, "5")])
+
+    def test_sorted_finger_inserts_stay_at_the_extremes(self):
+        """Test that sorted and reversed finger inserts climb nothing: 2 edges per key after the first."""
+        for keys in (range(1000), range(999, -1, -1)):
+            self.tree = ArrayAVLTree()
+            edges = sum(self.tree.finger_insert(key, key, self.tree.last_accessed())[1] for key in keys)
+            self.assertEqual(edges, 1998)
+            self.assertEqual(self.tree.finger_search(5000, self.tree.last_accessed())[1], 2)
+
+    def test_empty_tree(self):
+        """Test the accessors of an empty tree."""
+        self.assertIsNone(self.tree.get_root())
+        self.assertIsNone(self.tree.max_node())
+        self.assertEqual(self.tree.size(), 0)
+        self.assertEqual(self.tree.search(1), (None, -1))
+        self.assertEqual(self.tree.avl_to_array(), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+from AsyncAVLTree import AsyncAVLTree
+
+class TestAsyncAVLTree(unittest.IsolatedAsyncioTestCase):
+
+    async def test_writes_are_coalesced(self):
+        """Test that concurrent writes land in few batches and all complete."""
+        tree = AsyncAVLTree(max_batch=100, max_delay=10)
+        applied = []
+        insert_many = tree._tree.insert_many
+        tree._tree.insert_many = lambda items: applied.append(len(items)) or insert_many(items)
+
+        await asyncio.gather(*(tree.insert(key, str(key)) for key in range(300)))
+        self.assertEqual(applied, [100, 100, 100])
+        self.assertEqual(tree.size(), 300)
+        self.assertEqual(tree._tree.avl_to_array()[:2], [(0, "0"), (1, "1")])
+
+    async def test_flush_after_delay(self):
+        """Test that a partial batch is applied after max_delay."""
+        tree = AsyncAVLTree(max_batch=1000, max_delay=0.01)
+        await asyncio.wait_for(tree.insert(1, "a"), timeout=5)
+        self.assertEqual(tree.size(), 1)
+        self.assertEqual(set(tree.latency_percentiles()), {50, 99})
+
+    async def test_last_write_wins_and_reads_see_writes(self):
+        """Test that searches see queued writes and the last write to a key wins."""
+        tree = AsyncAVLTree(max_batch=1000, max_delay=10)
+        writes = [asyncio.ensure_future(tree.insert(key, "old")) for key in range(10)]
+        writes.append(asyncio.ensure_future(tree.delete(3)))
+        writes.append(asyncio.ensure_future(tree.insert(5, "new")))
+        await asyncio.sleep(0) # let the writes queue up
+
+        node, _ = await tree.search(5)
+        self.assertEqual(node.value, "new")
+        self.assertIsNone((await tree.search(3))[0])
+        await asyncio.gather(*writes)
+        self.assertEqual(tree.size(), 9)
+
+        await asyncio.gather(tree.delete(5), tree.delete(100), tree.flush())
+        self.assertIsNone((await tree.search(5))[0])
+
+    async def test_duplicates_keep_every_occurrence(self):
+        """Test that with duplicates every queued write counts, in order, per key."""
+        tree = AsyncAVLTree(max_batch=1000, max_delay=10, duplicates='bucket')
+        await asyncio.gather(tree.insert(5, "a"), tree.insert(5, "b"), tree.insert(5, "c"), tree.flush())
+        self.assertEqual(tree.size(), 3)
+        self.assertEqual((await tree.search(5))[0].value, ["a", "b", "c"])
+
+        await asyncio.gather(tree.delete(5), tree.insert(5, "d"), tree.insert(5, "e"), tree.delete(5),
+                             tree.insert(7, "f"), tree.flush())
+        self.assertEqual(tree.size(), 4)
+        self.assertEqual(tree._tree.avl_to_array(), [(5, "a"), (5, "b"), (5, "d"), (7, "f")])
+
+    async def test_key_function(self):
+        """Test that writes of unhashable records coalesce and are read back by equal records."""
+        tree = AsyncAVLTree(max_batch=1000, max_delay=10, key=lambda record: record["id"])
+        writes = [asyncio.ensure_future(tree.insert({"id": i, "v": "old"}, "old")) for i in range(5)]
+        writes.append(asyncio.ensure_future(tree.insert({"id": 3, "v": "new"}, "new")))
+        writes.append(asyncio.ensure_future(tree.delete({"id": 4})))
+        await asyncio.sleep(0)
+
+        node, _ = await tree.search({"id": 3})
+        self.assertEqual((node.record, node.value), ({"id": 3, "v": "new"}, "new"))
+        await asyncio.gather(*writes)
+        self.assertEqual(tree.size(), 4)
+        self.assertIsNone((await tree.search({"id": 4}))[0])
+
+if __name__ == "__main__":
+    unittest.main()
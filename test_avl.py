@@ -1,5 +1,9 @@
+import os
+import random
+import struct
+import tempfile
 import unittest
-from AVLTree import AVLNode, AVLTree
+from AVLTree import AVLNode, AVLTree, numpy
 
 class TestAVLTree(unittest.TestCase):
 
@@ -7,6 +11,39 @@ class TestAVLTree(unittest.TestCase):
         """Set up an empty AVL tree before each test."""
         self.tree = AVLTree()
 
+    def check_invariants(self, tree):
+        """Checks order, parent links, threads, heights and balance of every node, plus size, min and max."""
+        in_order = []
+        def check(node, parent):
+            if not node.is_real_node():
+                return -1
+            self.assertIs(node.parent, parent)
+            left_height = check(node.left, node)
+            in_order.append(node)
+            right_height = check(node.right, node)
+            self.assertLessEqual(abs(left_height - right_height), 1)
+            self.assertEqual(node.height, 1 + max(left_height, right_height))
+            self.assertEqual(node.size, node.count + node.left.size + node.right.size)
+            return node.height
+        if tree.get_root() is not None:
+            check(tree.get_root(), None)
+        for previous, node in zip([None] + in_order, in_order + [None]):
+            if previous is not None:
+                self.assertIs(previous.next(), node)
+            if node is not None:
+                self.assertIs(node.prev(), previous)
+        keys = [key for key, _ in tree.avl_to_array()] # as given, e.g. records with a key function
+        self.assertEqual(keys, [node.record if tree._key_func is not None else node.key
+                                for node in in_order for _ in range(node.count)])
+        compared = [node.key for node in in_order]
+        self.assertEqual(compared, sorted(set(compared)))
+        self.assertEqual(tree.size(), len(keys))
+        if keys:
+            self.assertEqual(tree._min.key, compared[0])
+            self.assertEqual(tree.max_node().key, compared[-1])
+        else:
+            self.assertIsNone(tree.max_node())
+
     def test_insert_and_search(self):
         """Test insertion and search functionality."""
         # Insert nodes
@@ -46,6 +83,44 @@ class TestAVLTree(unittest.TestCase):
         self.assertEqual(node.key, 20)
         self.assertEqual(node.value, "B")
 
+    def test_finger_from_any_node(self):
+        """Test finger operations from a given node and from the last accessed node."""
+        self.tree = AVLTree.from_sorted((key, str(key)) for key in range(0, 2000, 2))
+        start = self.tree.search(1000)[0]
+        self.assertIs(self.tree.last_accessed(), start)
+
+        node, edges = self.tree.finger_search(1002, start)
+        self.assertEqual(node.key, 1002)
+        self.assertLess(edges, self.tree.finger_search(1002)[1])
+        self.assertIsNone(self.tree.finger_search(1001, self.tree.last_accessed())[0])
+
+        new_node, _, _ = self.tree.finger_insert(1001, "new", self.tree.last_accessed())
+        self.assertIs(self.tree.last_accessed(), new_node)
+        for key in [999, 997, -5, 5000]:
+            self.tree.finger_insert(key, "", self.tree.last_accessed())
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.finger_search(-5, self.tree.search(1500)[0])[0].key, -5)
+
+        self.tree.delete(self.tree.last_accessed())
+        self.assertIsNone(self.tree.last_accessed())
+
+    def test_sorted_finger_inserts_stay_at_the_extremes(self):
+        """Test that sorted and reversed finger inserts climb nothing: 2 edges per key after the first."""
+        for keys in (range(1000), range(999, -1, -1)):
+            self.tree = AVLTree()
+            edges = sum(self.tree.finger_insert(key, key, self.tree.last_accessed())[1] for key in keys)
+            self.assertEqual(edges, 1998)
+            self.assertEqual(self.tree.finger_search(5000, self.tree.last_accessed())[1], 2)
+
+    def test_finger_search_near_last_accessed(self):
+        """Test clustered finger searches walk fewer edges than searches from the root."""
+        self.tree = AVLTree.from_sorted((key, "") for key in range(10000))
+        finger_edges = root_edges = 0
+        for key in range(5000, 5200):
+            finger_edges += self.tree.finger_search(key, self.tree.last_accessed())[1]
+            root_edges += self.tree.search(key)[1]
+        self.assertLess(finger_edges, root_edges / 2)
+
     def test_delete_cases(self):
         """Test different cases for deletion."""
         # Insert nodes
@@ -71,6 +146,49 @@ class TestAVLTree(unittest.TestCase):
         self.tree.delete(node)
         self.assertIsNone(self.tree.search(30)[0])
 
+    def test_delete_extremes_and_aggregates(self):
+        """Test that deletes keep min, max, sizes and aggregates right when retracing stops early."""
+        self.tree = AVLTree(combine=lambda a, b: a + b, identity=0)
+        keys = [(key * 211) % 1009 for key in range(600)]
+        for key in keys:
+            self.tree.insert(key, key)
+        for i, key in enumerate(keys[:400]):
+            node = self.tree.max_node() if i % 3 == 0 else self.tree._min if i % 3 == 1 else self.tree.search(key)[0]
+            if node is not None:
+                self.tree.delete(node)
+            if i % 50 == 0:
+                self.check_invariants(self.tree)
+        self.check_invariants(self.tree)
+        expected = sum(key for key, _ in self.tree.avl_to_array())
+        self.assertEqual(self.tree.aggregate(), expected)
+
+    def test_delete_retrace_stops_early(self):
+        """Test that delete retraces fewer nodes than a retrace to the root, with the same rotations."""
+        class FullRetraceTree(AVLTree):
+            def _retrace_delete(self, node):
+                self._retrace(node)
+
+        rng = random.Random(12)
+        keys = list(range(2000))
+        rng.shuffle(keys)
+        order = keys[:]
+        rng.shuffle(order)
+        counts = []
+        for cls in (AVLTree, FullRetraceTree):
+            self.tree = cls()
+            for key in keys:
+                self.tree.insert(key, key)
+            stats = self.tree.enable_stats()
+            for i, key in enumerate(order):
+                self.tree.delete(self.tree.search(key)[0])
+                if i % 500 == 0:
+                    self.check_invariants(self.tree)
+            self.assertEqual(self.tree.size(), 0)
+            counts.append(stats.counts)
+        early, full = counts
+        self.assertEqual(early.get("rotations", 0), full.get("rotations", 0))
+        self.assertLess(2 * early["height_updates"], full["height_updates"])
+
     def test_max_cases(self):
         """Test different cases for max retrieval."""
         # Insert nodes
@@ -130,6 +248,28 @@ class TestAVLTree(unittest.TestCase):
 
         self.assertTrue(check_virtual(self.tree.get_root()))
 
+    def test_virtual_nodes_are_shared(self):
+        """Check every empty child slot points at the same immutable virtual node."""
+        for key in [20, 10, 30, 5, 15, 25, 35]:
+            self.tree.insert(key, str(key))
+        self.tree.delete(self.tree.search(10)[0])
+
+        virtual_nodes = set()
+        def collect(node):
+            if not node.is_real_node():
+                virtual_nodes.add(id(node))
+                return
+            self.assertFalse(hasattr(node, '__dict__'))
+            collect(node.left)
+            collect(node.right)
+        collect(self.tree.get_root())
+
+        self.assertEqual(len(virtual_nodes), 1)
+        virtual = self.tree.max_node().right
+        self.assertIsNone(virtual.parent)
+        with self.assertRaises(AttributeError):
+            virtual.parent = self.tree.get_root()
+
     def test_promote_returns(self):
         """Test promote returns for insert and finger_insert."""
         _, _, promotes = self.tree.insert(3, "A")
@@ -182,9 +322,28 @@ class TestAVLTree(unittest.TestCase):
         self.assertNotIn(split_key, left_keys, f"Split key {split_key} found in left tree.")
         self.assertNotIn(split_key, right_keys, f"Split key {split_key} found in right tree.")
 
+        # Validate that no other key was lost
+        self.assertEqual(left_keys + right_keys, [5, 10, 15, 25, 30, 35])
+
         # Success message
         print("Success: The split function works as expected without relying on size!")
 
+    def test_split_sizes_and_extremes(self):
+        """Test that split parts get the right size, min and max, including at the extremes."""
+        self.tree = AVLTree.from_sorted((key, "") for key in range(500))
+        left, right = self.tree.split(self.tree.search(137)[0])
+        self.check_invariants(left)
+        self.check_invariants(right)
+        self.assertEqual((left.size(), left._min.key, left.max_node().key), (137, 0, 136))
+        self.assertEqual((right.size(), right._min.key, right.max_node().key), (362, 138, 499))
+        self.assertIsNone(self.tree.get_root())
+
+        left, right = right.split(right._min)
+        self.assertEqual(left.size(), 0)
+        self.assertIsNone(left.max_node())
+        self.check_invariants(right)
+        self.assertEqual(right._min.key, 139)
+
     def test_join(self):
         """Test joining two AVL trees."""
         tree1 = AVLTree()
@@ -201,6 +360,103 @@ class TestAVLTree(unittest.TestCase):
         self.assertEqual(tree1.size(), 3)
         self.assertEqual(tree1.search(20)[0].value, "C")
 
+    def test_join_taller_self(self):
+        """Test joining a short tree into a taller one keeps the result in self."""
+        self.tree = AVLTree.from_sorted((key, "") for key in range(100, 200))
+        tree2 = AVLTree()
+        tree2.insert(10, "")
+        self.tree.join(tree2, 50, "")
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 102)
+        self.assertEqual(self.tree._min.key, 10)
+
+    def test_join_empties_tree2(self):
+        """Test that join leaves tree2 empty and usable, in both key orders and with an index."""
+        for index in (False, True):
+            for smaller in (True, False):
+                self.tree = AVLTree.from_sorted(((key, "") for key in range(100, 200)), index=index)
+                tree2 = AVLTree.from_sorted(((key, "") for key in (range(10, 40) if smaller else range(300, 330))),
+                                            index=index)
+                self.tree.join(tree2, 50 if smaller else 250, "")
+                self.check_invariants(self.tree)
+                self.assertEqual(self.tree.size(), 131)
+                self.assertEqual(tree2.size(), 0)
+                self.assertIsNone(tree2.get_root())
+                self.assertIsNone(tree2.max_node())
+                self.assertIsNone(tree2.search(20)[0])
+                self.assertEqual(tree2.avl_to_array(), [])
+                tree2.insert(5, "") # tree2 shares no nodes with self any more
+                self.check_invariants(tree2)
+                self.assertIsNone(self.tree.search(5)[0])
+                self.assertEqual(self.tree.search(120)[0].key, 120)
+
+    def test_union(self):
+        """Test union with a merge callback, in both size orders."""
+        self.tree = AVLTree.from_sorted((key, 1) for key in range(0, 300, 3))
+        tree2 = AVLTree.from_sorted((key, 10) for key in range(0, 40, 2))
+        self.tree.union(tree2, merge=lambda mine, theirs: mine + theirs)
+        self.check_invariants(self.tree)
+        self.assertEqual(tree2.size(), 0)
+        self.assertEqual(self.tree.size(), 100 + 20 - 7)
+        self.assertEqual(self.tree.search(6)[0].value, 11)
+        self.assertEqual(self.tree.search(4)[0].value, 10)
+
+        small = AVLTree.from_sorted([(6, 100), (1000, 100)])
+        small.union(self.tree)
+        self.check_invariants(small)
+        self.assertEqual(small.size(), 114)
+        self.assertEqual(small.search(6)[0].value, 11) # the value from the second tree wins
+
+    def test_intersection_and_difference(self):
+        """Test intersection and difference against plain set operations."""
+        keys1, keys2 = set(range(0, 500, 2)), set(range(0, 500, 3))
+        self.tree = AVLTree.from_sorted((key, "a") for key in sorted(keys1))
+        self.tree.intersection(AVLTree.from_sorted((key, "b") for key in sorted(keys2)),
+                               merge=lambda mine, theirs: mine + theirs)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.avl_to_array(), [(key, "ab") for key in sorted(keys1 & keys2)])
+
+        self.tree = AVLTree.from_sorted((key, "a") for key in sorted(keys1))
+        self.tree.difference(AVLTree.from_sorted((key, "b") for key in sorted(keys2)))
+        self.check_invariants(self.tree)
+        self.assertEqual(list(self.tree), sorted(keys1 - keys2))
+
+        self.tree.difference(AVLTree.from_sorted((key, "") for key in range(500)))
+        self.assertIsNone(self.tree.get_root())
+        self.assertEqual(self.tree.size(), 0)
+
+    def test_insert_many(self):
+        """Test batch inserts through both the split/join path and the rebuild path."""
+        self.tree = AVLTree.from_sorted((key, "old") for key in range(0, 2000, 2))
+        added = self.tree.insert_many([(7, "a"), (3, "b"), (4, "new"), (7, "c"), (5000, "d")])
+        self.assertEqual(added, 3)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.search(7)[0].value, "c")
+        self.assertEqual(self.tree.search(4)[0].value, "new")
+        self.assertEqual(self.tree.max_node().key, 5000)
+
+        added = self.tree.insert_many((key, "odd") for key in range(1999, -1, -2))
+        self.assertEqual(added, 998)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 2001)
+
+    def test_delete_many(self):
+        """Test batch deletes through both paths, ignoring missing keys."""
+        self.tree.insert_many((key, str(key)) for key in range(1000))
+        removed = self.tree.delete_many([0, 999, 500, 500, 5000])
+        self.assertEqual(removed, 3)
+        self.check_invariants(self.tree)
+        self.assertIsNone(self.tree.search(500)[0])
+
+        removed = self.tree.delete_many(range(0, 1000, 2))
+        self.assertEqual(removed, 498)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.avl_to_array()[:2], [(1, "1"), (3, "3")])
+
+        self.tree.delete_many(range(1000))
+        self.assertIsNone(self.tree.get_root())
+        self.assertEqual(self.tree.size(), 0)
+
     def test_avl_to_array(self):
         """Test conversion of the AVL tree to an array."""
         # Insert nodes
@@ -212,6 +468,449 @@ class TestAVLTree(unittest.TestCase):
         arr = self.tree.avl_to_array()
         self.assertEqual(arr, [(10, "A"), (20, "B"), (30, "C")])
 
+    def test_from_sorted(self):
+        """Test bulk construction from sorted items for several sizes."""
+        for n in [0, 1, 2, 3, 7, 8, 100, 1000]:
+            items = [(key, str(key)) for key in range(n)]
+            tree = AVLTree.from_sorted(iter(items))
+            self.check_invariants(tree)
+            self.assertEqual(tree.avl_to_array(), items)
+            if n:
+                self.assertEqual(tree.get_root().height, n.bit_length() - 1)
+
+    def test_from_sorted_then_update(self):
+        """Test a bulk-built tree supports inserts, deletes and finger operations."""
+        self.tree = AVLTree.from_sorted((key, "") for key in range(0, 200, 2))
+        self.tree.insert(51, "")
+        self.tree.finger_insert(1000, "")
+        self.tree.delete(self.tree.search(0)[0])
+        self.tree.delete(self.tree.search(100)[0])
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.finger_search(198)[0].key, 198)
+        self.assertEqual(self.tree.size(), 100)
+
+    def test_iterators(self):
+        """Test keys, values, items and both iteration orders."""
+        self.assertEqual(list(self.tree), [])
+        self.assertEqual(list(reversed(self.tree)), [])
+        for key in [30, 10, 20, 50, 40]:
+            self.tree.insert(key, str(key))
+
+        self.assertEqual(list(self.tree), [10, 20, 30, 40, 50])
+        self.assertEqual(list(self.tree.keys()), [10, 20, 30, 40, 50])
+        self.assertEqual(list(self.tree.values()), ["10", "20", "30", "40", "50"])
+        self.assertEqual(list(reversed(self.tree)), [50, 40, 30, 20, 10])
+        self.assertEqual(next(self.tree.items()), (10, "10"))
+
+    def test_range_scans(self):
+        """Test bounded scans with exclusive bounds, reverse order and limits."""
+        self.tree = AVLTree.from_sorted((key, str(key)) for key in range(0, 100, 10))
+
+        self.assertEqual(list(self.tree.keys(20, 50)), [20, 30, 40, 50])
+        self.assertEqual(list(self.tree.keys(20, 50, inclusive=(False, False))), [30, 40])
+        self.assertEqual(list(self.tree.keys(15, 45)), [20, 30, 40])
+        self.assertEqual(list(self.tree.keys(hi=25)), [0, 10, 20])
+        self.assertEqual(list(self.tree.keys(lo=75)), [80, 90])
+        self.assertEqual(list(self.tree.keys(20, 50, reverse=True)), [50, 40, 30, 20])
+        self.assertEqual(list(self.tree.keys(lo=20, reverse=True, limit=2)), [90, 80])
+        self.assertEqual(list(self.tree.items(35, 45)), [(40, "40")])
+        self.assertEqual(list(self.tree.values(50, 20)), [])
+        self.assertEqual(list(self.tree.keys(100, 200)), [])
+
+    def test_rank_select_count_range(self):
+        """Test order statistics after inserts, deletes, joins and batch updates."""
+        for key in range(0, 100, 2):
+            self.tree.finger_insert(key, str(key))
+        self.tree.delete(self.tree.search(50)[0])
+        self.tree.insert_many([(51, ""), (1, "")])
+        self.check_invariants(self.tree)
+        keys = list(self.tree)
+
+        for i, key in enumerate(keys):
+            self.assertEqual(self.tree.rank(key), i)
+            self.assertEqual(self.tree.select(i).key, key)
+        self.assertEqual(self.tree.rank(-5), 0)
+        self.assertEqual(self.tree.rank(3), 3)
+        self.assertEqual(self.tree.rank(1000), len(keys))
+        self.assertEqual(self.tree.select(-1).key, 98)
+        self.assertIsNone(self.tree.select(len(keys)))
+
+        self.assertEqual(self.tree.count_range(10, 20), 6)
+        self.assertEqual(self.tree.count_range(10, 20, inclusive=(False, False)), 4)
+        self.assertEqual(self.tree.count_range(hi=5), 4)
+        self.assertEqual(self.tree.count_range(), len(keys))
+        self.assertEqual(self.tree.count_range(20, 10), 0)
+
+    def test_aggregate(self):
+        """Test range sums and maxima stay current through updates, split and join."""
+        self.tree = AVLTree.from_sorted(((key, key) for key in range(1, 101)), combine=lambda a, b: a + b, identity=0)
+        self.assertEqual(self.tree.aggregate(), 5050)
+        self.assertEqual(self.tree.aggregate(10, 20), 165)
+        self.assertEqual(self.tree.aggregate(10, 20, inclusive=(False, False)), 135)
+        self.assertEqual(self.tree.aggregate(200, 300), 0)
+
+        self.tree.delete(self.tree.search(15)[0])
+        self.tree.insert(1000, 1)
+        self.tree.set_value(self.tree.search(20)[0], 0)
+        self.assertEqual(self.tree.aggregate(10, 20), 130)
+        self.assertEqual(self.tree.aggregate(lo=100), 101)
+
+        left_tree, right_tree = self.tree.split(self.tree.search(50)[0])
+        self.assertEqual(left_tree.aggregate(), sum(range(1, 50)) - 15 - 20)
+        self.assertEqual(right_tree.aggregate(hi=60), sum(range(51, 61)))
+
+        maxima = AVLTree(combine=max, identity=float("-inf"))
+        maxima.insert_many([(key, (key * 7) % 13) for key in range(100)])
+        self.assertEqual(maxima.aggregate(0, 5), 9)
+        self.assertEqual(maxima.aggregate(6, 6), 3)
+
+    def test_aggregate_keeps_key_order(self):
+        """Test a non-commutative combine sees the values in key order."""
+        self.tree = AVLTree(combine=lambda a, b: a + b, identity="")
+        for key in [5, 3, 8, 1, 4, 7, 9, 2, 6]:
+            self.tree.insert(key, str(key))
+        self.assertEqual(self.tree.aggregate(), "123456789")
+        self.assertEqual(self.tree.aggregate(3, 7), "34567")
+        with self.assertRaises(ValueError):
+            AVLTree().aggregate()
+
+    def test_threaded_cursor(self):
+        """Test stepping between neighbouring nodes with next() and prev()."""
+        keys = [(key * 37) % 1000 for key in range(300)]
+        for key in keys:
+            self.tree.insert(key, str(key))
+        node, _ = self.tree.search(min(keys))
+        stepped = []
+        while node is not None:
+            stepped.append(node.key)
+            node = node.next()
+        self.assertEqual(stepped, sorted(keys))
+        node = self.tree.max_node()
+        self.assertIsNone(node.next())
+        self.assertEqual(node.prev().key, sorted(keys)[-2])
+
+    def test_threads_survive_updates(self):
+        """Test that the threaded links stay consistent through every kind of update."""
+        keys = [(key * 7919) % 10007 for key in range(500)]
+        for key in keys:
+            self.tree.insert(key, key)
+        for key in keys[:150]:
+            self.tree.delete(self.tree.search(key)[0])
+        self.check_invariants(self.tree)
+        self.tree.insert_many((key, key) for key in range(19000, 10000, -250))
+        self.tree.delete_many(keys[150:190])
+        self.check_invariants(self.tree)
+        self.tree.insert_many((key, key) for key in range(20000, 21000))
+        self.check_invariants(self.tree)
+
+        node = self.tree.select(self.tree.size() // 2)
+        left, right = self.tree.split(node)
+        self.check_invariants(left)
+        self.check_invariants(right)
+        self.assertIsNone(left.max_node().next())
+        self.assertIsNone(right._min.prev())
+        left.join(right, node.key, node.value)
+        self.check_invariants(left)
+
+    def test_save_and_load(self):
+        """Test that save/load round-trips packed and pickled columns and rebuilds a valid tree."""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "tree.avl")
+        cases = [
+            [(key, "value %d \u05d0" % key) for key in range(-500, 500)], # int64 keys, str values
+            [("key %03d" % key, (key, None)) for key in range(300)], # str keys, pickled values
+            [],
+        ]
+        for items in cases:
+            self.tree = AVLTree.from_sorted(items)
+            self.tree.save(path)
+            loaded = AVLTree.load(path)
+            self.check_invariants(loaded)
+            self.assertEqual(loaded.avl_to_array(), items)
+
+        self.tree = AVLTree.from_sorted((key, key) for key in range(100))
+        self.tree.save(path)
+        loaded = AVLTree.load(path, combine=lambda a, b: a + b, identity=0)
+        self.assertEqual(loaded.aggregate(10, 19), sum(range(10, 20)))
+
+        with open(path, "wb") as file:
+            file.write(b"not a tree")
+        self.assertRaises(ValueError, AVLTree.load, path)
+        os.remove(path)
+        os.rmdir(directory)
+
+    def test_load_rejects_mismatched_or_damaged_files(self):
+        """Test that load raises ValueError for another duplicates option, truncation and short columns."""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "tree.avl")
+        self.tree = AVLTree(duplicates='count')
+        for key in [3, 1, 3, 2, 3]:
+            self.tree.insert(key, None)
+        self.tree.save(path)
+        self.assertRaises(ValueError, AVLTree.load, path) # sorted but not strictly increasing keys
+        self.assertRaises(ValueError, AVLTree.load, path, duplicates='bucket')
+        self.assertEqual(AVLTree.load(path, duplicates='count').size(), 5)
+
+        self.tree = AVLTree.from_sorted((key, key) for key in range(50))
+        self.tree.save(path)
+        with open(path, "rb") as file:
+            data = file.read()
+        for length in [10, 18, 20, len(data) - 1]: # inside the header, the first column length, the data
+            with open(path, "wb") as file:
+                file.write(data[:length])
+            self.assertRaises(ValueError, AVLTree.load, path)
+
+        header_size = 17 # the version 2 header and its duplicates byte
+        with open(path, "wb") as file: # claim one more item than both columns hold
+            file.write(data[:8] + struct.pack("<Q", 51) + data[16:])
+        self.assertRaises(ValueError, AVLTree.load, path)
+        with open(path, "wb") as file: # drop the last key but keep the claimed count
+            length, = struct.unpack("<Q", data[header_size:header_size + 8])
+            file.write(data[:header_size] + struct.pack("<Q", length - 8)
+                       + data[header_size + 8:header_size + 8 + length - 8] + data[header_size + 8 + length:])
+        self.assertRaises(ValueError, AVLTree.load, path)
+        os.remove(path)
+        os.rmdir(directory)
+
+    def test_hash_index(self):
+        """Test that the side index follows every update and ordered operations still work."""
+        self.tree = AVLTree(index=True)
+        for key in range(0, 400, 2):
+            self.tree.insert(key, str(key))
+        self.tree.finger_insert(401, "401", self.tree.last_accessed())
+        self.tree.delete(self.tree.search(100)[0])
+        self.tree.insert_many([(1, "1"), (3, "3")])
+        self.tree.delete_many([0, 2])
+        self.assertEqual(self.tree.search(251), (None, 1))
+        self.assertEqual(self.tree.search(398)[0].value, "398")
+        self.assertIsNone(self.tree.search(100)[0])
+        self.assertEqual(self.tree.finger_search(396, self.tree.last_accessed())[0].key, 396)
+        self.assertEqual(self.tree.rank(10), 5) # 1, 3, 4, 6, 8
+
+        left, right = self.tree.split(self.tree.search(300)[0])
+        self.assertEqual(set(left._index), set(left))
+        self.assertEqual(set(right._index), set(right))
+        self.assertIsNone(left.search(302)[0])
+        self.assertEqual(right.search(302)[0].key, 302)
+        left.join(right, 300, "300")
+        self.check_invariants(left)
+        self.assertEqual(set(left._index), set(left))
+        self.assertEqual(left.search(300)[0].value, "300")
+
+    def test_hash_index_with_unindexed_tree(self):
+        """Test that an indexed tree keeps a complete index after join and union with plain trees."""
+        self.tree = AVLTree(index=True)
+        self.tree.join(AVLTree(), 5, "5")
+        self.assertEqual(self.tree.search(5), (self.tree.get_root(), 1))
+        self.tree.join(AVLTree.from_sorted((key, str(key)) for key in range(10, 40)), 7, "7")
+        self.check_invariants(self.tree)
+        self.assertEqual(set(self.tree._index), set(self.tree))
+
+        self.tree.union(AVLTree.from_sorted((key, str(key)) for key in range(0, 300, 3))) # the larger tree
+        self.check_invariants(self.tree)
+        self.assertEqual(set(self.tree._index), set(self.tree))
+        self.assertEqual(self.tree.search(297)[0].value, "297")
+
+        plain = AVLTree.from_sorted([(1, "1")])
+        plain.union(self.tree)
+        self.assertIsNone(plain._index)
+        self.check_invariants(plain)
+
+    def test_search_many(self):
+        """Test batch search against search, with repeats, misses and both search modes."""
+        keys = [(key * 7919) % 10007 for key in range(3000)]
+        queries = [(key * 31) % 12000 for key in range(2000)] + [5, 5, -1]
+        for index in (False, True):
+            self.tree = AVLTree(index=index)
+            for key in keys:
+                self.tree.insert(key, str(key))
+            found, values, edges = self.tree.search_many(queries, edges=True)
+            for i, key in enumerate(queries):
+                node, _ = self.tree.search(key)
+                self.assertEqual(found[i], node is not None)
+                self.assertEqual(values[i], node.value if node is not None else None)
+                self.assertGreaterEqual(edges[i], 1)
+        self.assertEqual(AVLTree().search_many([1, 2], edges=True), ([False, False], [None, None], [-1, -1]))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_search_many_numpy(self):
+        """Test that numpy input gives aligned numpy results."""
+        self.tree = AVLTree.from_sorted((key, (key, key)) for key in range(0, 100, 2))
+        found, values = self.tree.search_many(numpy.array([4, 3, 98]))
+        self.assertEqual(found.tolist(), [True, False, True])
+        self.assertEqual(values.dtype, object)
+        self.assertEqual(values[0], (4, 4))
+        self.assertIsNone(values[1])
+
+    def test_duplicates_count(self):
+        """Test a multiset: one node per key, and counts in sizes, ranks and iteration."""
+        self.tree = AVLTree(duplicates='count')
+        for i in range(300):
+            self.tree.insert((i * 37) % 50, "v")
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 300)
+        self.assertEqual(len(self.tree._subtree_nodes(self.tree.get_root())), 50)
+        node, _, promote = self.tree.insert(10, "w")
+        self.assertEqual((node.key, node.count, node.value, promote), (10, 7, "v", 0))
+        self.assertEqual(self.tree.rank(10), 60)
+        self.assertIs(self.tree.select(60), node)
+        self.assertIs(self.tree.select(66), node)
+        self.assertEqual(self.tree.select(67).key, 11)
+        self.assertEqual(self.tree.count_range(10, 11), 13)
+        self.assertEqual(list(self.tree.keys(10, limit=8)), [10] * 7 + [11])
+
+        for _ in range(6):
+            self.tree.delete(node)
+        self.assertEqual(node.count, 1)
+        self.assertIs(self.tree.search(10)[0], node)
+        self.tree.delete(node)
+        self.assertIsNone(self.tree.search(10)[0])
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.delete_many([0, 1, 10]), 12)
+        self.assertEqual(self.tree.size(), 282)
+        self.check_invariants(self.tree)
+
+    def test_node_fields_follow_options(self):
+        """Test that only trees with combine or duplicates get nodes with agg or count fields."""
+        plain = self.tree.insert(1, "a")[0]
+        self.assertFalse(hasattr(plain, "agg"))
+        self.assertEqual(plain.count, 1)
+        with self.assertRaises(AttributeError):
+            plain.count = 2
+        self.assertEqual(AVLTree(combine=max).insert(1, 5)[0].agg, 5)
+        self.assertEqual(AVLTree(duplicates='count').insert(1, "a")[0].count, 1)
+
+    def test_duplicates_bucket(self):
+        """Test a multimap: values kept per key in insertion order through every update."""
+        self.tree = AVLTree(duplicates='bucket')
+        for key in range(0, 100, 2):
+            self.tree.insert(key, "a%d" % key)
+        self.tree.finger_insert(4, "b4", self.tree.last_accessed())
+        self.tree.insert_many([(4, "c4"), (5, "a5"), (6, "b6"), (5, "b5")])
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.search(4)[0].value, ["a4", "b4", "c4"])
+        self.assertEqual(list(self.tree.items(4, 6)),
+                         [(4, "a4"), (4, "b4"), (4, "c4"), (5, "a5"), (5, "b5"), (6, "a6"), (6, "b6")])
+        self.assertEqual(list(self.tree.values(4, 5, reverse=True)), ["b5", "a5", "c4", "b4", "a4"])
+        self.assertEqual(self.tree.size(), 55)
+
+        node = self.tree.search(4)[0]
+        self.tree.delete(node)
+        self.assertEqual(node.value, ["a4", "b4"])
+        self.tree.insert_many((key, "d") for key in range(100)) # rebuilds
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 154)
+        self.assertEqual(self.tree.search(4)[0].value, ["a4", "b4", "d"])
+
+        below = self.tree.rank(50)
+        left, right = self.tree.split(self.tree.search(50)[0])
+        self.assertEqual((left.size(), right.size()), (below, 154 - below - 2))
+        left.join(right, 50, "e")
+        self.check_invariants(left)
+        self.assertEqual(left.search(50)[0].value, ["e"])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.avl")
+            left.save(path)
+            loaded = AVLTree.load(path, duplicates='bucket')
+        self.check_invariants(loaded)
+        self.assertEqual(loaded.avl_to_array(), left.avl_to_array())
+        with self.assertRaises(ValueError):
+            left.union(loaded)
+        with self.assertRaises(ValueError):
+            AVLTree(combine=max, duplicates='count')
+
+    def test_key_function(self):
+        """Test a tree of records ordered by a key function, cached once per node."""
+        calls = []
+        def name(record):
+            calls.append(record)
+            return record["last"], record["first"]
+        people = [{"last": last, "first": first} for last in "dbca" for first in "yxz"]
+        for index in (False, True):
+            calls.clear()
+            self.tree = AVLTree(key=name, index=index)
+            for person in people:
+                self.tree.insert(person, person["first"] + person["last"])
+            self.check_invariants(self.tree)
+            self.assertEqual(len(calls), len(people)) # never recomputed along the descents
+            node, _ = self.tree.search({"last": "b", "first": "x"})
+            self.assertEqual((node.key, node.value), (("b", "x"), "xb"))
+            self.assertIs(node.record, people[4])
+            self.assertEqual(len(calls), len(people) + 1)
+
+        self.assertEqual(next(iter(self.tree)), {"last": "a", "first": "x"})
+        self.assertEqual(self.tree.rank({"last": "b", "first": "x"}), 3)
+        self.assertEqual(self.tree.count_range({"last": "b", "first": ""}, {"last": "c", "first": ""}), 3)
+        self.assertEqual([p["first"] for p in self.tree.keys({"last": "c", "first": ""}, limit=2)], ["x", "y"])
+        self.tree.insert_many([({"last": "e", "first": "x"}, "xe"), ({"last": "a", "first": "x"}, "xa2")])
+        self.tree.delete_many([{"last": "d", "first": "z"}])
+        self.tree.finger_insert({"last": "b", "first": "w"}, "wb", self.tree.last_accessed())
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.search({"last": "a", "first": "x"})[0].value, "xa2")
+        self.assertIsNone(self.tree.search({"last": "d", "first": "z"})[0])
+
+        left, right = self.tree.split(self.tree.search({"last": "c", "first": "x"})[0])
+        left.join(right, {"last": "c", "first": "x"}, "xc")
+        self.check_invariants(left)
+        other = AVLTree.from_sorted([({"last": "f", "first": "a"}, "af")], key=name)
+        left.union(other)
+        self.check_invariants(left)
+        self.assertEqual(left.avl_to_array()[-1], ({"last": "f", "first": "a"}, "af"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.avl")
+            left.save(path)
+            loaded = AVLTree.load(path, key=name)
+        self.check_invariants(loaded)
+        self.assertEqual(loaded.avl_to_array(), left.avl_to_array())
+
+    def test_stats(self):
+        """Test counters, histograms and the hook, and that disabling removes every wrapper."""
+        calls = []
+        stats = self.tree.enable_stats(timing=True, hook=lambda operation, seconds: calls.append(operation))
+        for key in range(100):
+            self.tree.insert(key, "")
+        self.tree.search(5)
+        self.tree.delete(self.tree.search(50)[0])
+        self.tree.delete_many(range(80))
+
+        counts = stats.counts
+        self.assertEqual(counts["insert"], 100)
+        self.assertEqual(counts["search"], 2)
+        self.assertGreater(counts["rotations"], 0)
+        self.assertGreater(counts["height_updates"], counts["rotations"])
+        self.assertEqual(counts["min_max_walks"], 1) # delete_many
+        self.assertEqual(sum(stats.histograms["insert"].values()), 100)
+        self.assertEqual(len(calls), 104)
+        self.assertEqual(stats.snapshot()["counts"], counts)
+        self.assertIs(self.tree.stats(), stats)
+
+        self.tree.disable_stats()
+        self.assertIsNone(self.tree.stats())
+        self.assertEqual(set(self.tree.__dict__) & set(AVLTree.__dict__), set())
+        self.tree.insert(1000, "")
+        self.assertEqual(counts["insert"], 100)
+        self.check_invariants(self.tree)
+
+    def test_stats_count_each_call_once(self):
+        """Test that public operations built on other public operations are counted once."""
+        stats = self.tree.enable_stats()
+        self.tree.finger_insert(1, "a")
+        self.assertEqual(stats.counts, {"finger_insert": 1})
+
+        other = AVLTree.from_sorted((key, "") for key in range(2, 50))
+        other_stats = other.enable_stats()
+        self.tree.union(other, workers=2)
+        self.assertEqual(stats.counts["union"], 1)
+        self.assertNotIn("avl_to_array", stats.counts)
+        self.assertNotIn("avl_to_array", other_stats.counts)
+        self.assertEqual(self.tree.size(), 49)
+
+    def test_avl_to_array_large(self):
+        """Test avl_to_array on a tree too big for the old recursive implementation to be cheap."""
+        items = [(key, key) for key in range(100000)]
+        self.tree = AVLTree.from_sorted(items)
+        self.assertEqual(self.tree.avl_to_array(), items)
+
     def test_max_node(self):
         """Test finding the node with the maximum key."""
         # Insert nodes
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_workloads_are_seeded_permutations(self):
+        """Test that every workload is a permutation of 0..n-1 that depends only on the seed."""
+        for name in benchmark.WORKLOADS:
+            keys = benchmark.workload(name, 500, random.Random(7))
+            self.assertEqual(sorted(keys), list(range(500)))
+            self.assertEqual(keys, benchmark.workload(name, 500, random.Random(7)))
+        self.assertNotEqual(benchmark.workload("random", 500, random.Random(7)),
+                            benchmark.workload("random", 500, random.Random(8)))
+        with self.assertRaises(ValueError):
+            benchmark.workload("unknown", 10, random.Random(0))
+
+    def test_experiments_run_only_when_named(self):
+        """Test that the default run times only the core operations and every experiment can be named."""
+        self.assertFalse(set(benchmark.OPERATIONS) & set(benchmark.EXPERIMENTS))
+        def operations(args):
+            with tempfile.TemporaryDirectory() as directory:
+                output = os.path.join(directory, "results.json")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertEqual(benchmark.main(args + ["--max-size", "1000", "--repeat", "1",
+                                                            "--workloads", "sorted", "--output", output]), 0)
+                with open(output) as file:
+                    return [record["operation"] for record in json.load(file)["results"]]
+        self.assertEqual(operations([]), benchmark.OPERATIONS)
+        self.assertEqual(operations(["--operations", ",".join(benchmark.EXPERIMENTS)]), benchmark.EXPERIMENTS)
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            benchmark.main(["--operations", "insert,unknown"])
+
+    def test_counted_cases_record_counts_per_op(self):
+        """Test that delete_counted records its rotations and height updates, the same for a seed."""
+        record = benchmark.measure("delete_counted", "random", 1000, 2, 0, False)
+        self.assertEqual(set(record["counts_per_op"]), {"rotations", "height_updates"})
+        self.assertGreater(record["counts_per_op"]["height_updates"], 1)
+        self.assertEqual(record["counts_per_op"],
+                         benchmark.measure("delete_counted", "random", 1000, 1, 0, False)["counts_per_op"])
+        self.assertNotIn("counts_per_op", benchmark.measure("delete", "random", 1000, 1, 0, False))
+
+    def test_compare(self):
+        """Test that compare flags slowdowns over the threshold and skips cases without a baseline."""
+        baseline = {"results": [{"operation": "insert", "workload": "random", "size": 1000, "ns_per_op": 100.0}]}
+        def record(operation, ns_per_op):
+            return {"operation": operation, "workload": "random", "size": 1000, "ns_per_op": ns_per_op}
+        slow, fast, new = record("insert", 120.0), record("insert", 105.0), record("search", 1e9)
+        self.assertEqual(benchmark.compare([slow, fast, new], baseline, 0.1), [(slow, 100.0)])
+        self.assertEqual(benchmark.compare([slow], baseline, 0.25), [])
+
+    def test_main_exit_status(self):
+        """Test that main writes JSON and exits with 1 only on a regression against the baseline."""
+        args = ["--max-size", "1000", "--repeat", "1", "--operations", "insert,search", "--workloads", "sorted"]
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(benchmark.main(args + ["--output", output]), 0)
+            with open(output) as file:
+                results = json.load(file)
+            self.assertEqual([(r["operation"], r["size"]) for r in results["results"]], [("insert", 1000), ("search", 1000)])
+
+            for scale, status in ((1e-6, 1), (1e6, 0)):
+                for record in results["results"]:
+                    record["ns_per_op"] *= scale
+                baseline = os.path.join(directory, "baseline.json")
+                with open(baseline, "w") as file:
+                    json.dump(results, file)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertEqual(benchmark.main(args + ["--baseline", baseline]), status)
+                for record in results["results"]:
+                    record["ns_per_op"] /= scale
+
+if __name__ == "__main__":
+    unittest.main()
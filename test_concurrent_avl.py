@@ -0,0 +1,92 @@
+import random
+import threading
+import unittest
+from ConcurrentAVLTree import ConcurrentAVLTree, _ReadWriteLock
+
+class TestConcurrentAVLTree(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an empty concurrent AVL tree before each test."""
+        self.tree = ConcurrentAVLTree()
+
+    def test_single_thread(self):
+        """Test the wrapped operations from one thread."""
+        self.tree.insert_many((key, str(key)) for key in range(100))
+        self.tree.insert(200, "x")
+        node, _ = self.tree.search(50)
+        self.assertTrue(self.tree.delete(node))
+        self.assertFalse(self.tree.delete(node)) # already gone
+        self.assertEqual(self.tree.delete_many(range(10)), 10)
+        self.assertEqual(self.tree.size(), 90)
+        self.assertEqual(self.tree.rank(60), 49)
+        self.assertEqual(self.tree.select(0).key, 10)
+        self.assertEqual(self.tree.items(lo=48, hi=52), [(48, "48"), (49, "49"), (51, "51"), (52, "52")])
+        self.assertEqual(self.tree.max_node().key, 200)
+
+    def test_writer_excludes_readers(self):
+        """Test that a writer waits for readers and keeps new readers out."""
+        lock = _ReadWriteLock()
+        lock.acquire_read()
+        lock.acquire_read()
+        writer_in = threading.Event()
+        def writer():
+            lock.acquire_write()
+            writer_in.set()
+            lock.release_write()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        self.assertFalse(writer_in.wait(0.05))
+        lock.release_read()
+        self.assertFalse(writer_in.wait(0.05))
+        lock.release_read()
+        self.assertTrue(writer_in.wait(5))
+        thread.join()
+
+    def check_readers_during_writes(self, tree):
+        """Checks that keys nobody deletes are always found while writers churn other keys."""
+        tree.insert_many((key, key) for key in range(0, 4000, 2))
+        errors = []
+        done = threading.Event()
+
+        def writer(seed):
+            rng = random.Random(seed)
+            for _ in range(3000):
+                key = rng.randrange(1, 4000, 2)
+                node, _ = tree.search(key)
+                if node is None:
+                    tree.insert_many([(key, key)])
+                else:
+                    tree.delete(node)
+
+        def reader(seed):
+            rng = random.Random(seed)
+            while not done.is_set():
+                key = rng.randrange(0, 4000, 2)
+                node, _ = tree.search(key)
+                if node is None or node.key != key:
+                    errors.append(key)
+
+        writers = [threading.Thread(target=writer, args=(seed,)) for seed in range(2)]
+        readers = [threading.Thread(target=reader, args=(seed,)) for seed in range(2, 6)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual(errors, [])
+        keys = [key for key, _ in tree.avl_to_array()]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(tree.size(), len(keys))
+
+    def test_locked_reads_during_writes(self):
+        """Test reads under the read lock while writers run."""
+        self.check_readers_during_writes(self.tree)
+
+    def test_optimistic_reads_during_writes(self):
+        """Test version-checked lock-free reads while writers run."""
+        self.check_readers_during_writes(ConcurrentAVLTree(optimistic=True))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import random
+import tempfile
+import unittest
+from AVLTree import AVLTree
+from FrozenAVLTree import FrozenAVLTree
+
+class TestFrozenAVLTree(unittest.TestCase):
+
+    def setUp(self):
+        """Freeze a tree with random keys into a temporary file before each test."""
+        random.seed(0)
+        self.keys = sorted(random.sample(range(-10 ** 12, 10 ** 12), 1000))
+        self.source = AVLTree.from_sorted((key, "v%d" % key) for key in self.keys)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "tree.frozen")
+        self.tree = FrozenAVLTree.freeze(self.source, self.path)
+
+    def tearDown(self):
+        self.tree.close()
+        os.remove(self.path)
+        os.rmdir(self.directory)
+
+    def test_search(self):
+        """Test searching present and missing keys."""
+        for i, key in enumerate(self.keys):
+            node, _ = self.tree.search(key)
+            self.assertEqual(node, i)
+            self.assertEqual(self.tree.get_key(node), key)
+            self.assertEqual(self.tree.get_value(node), "v%d" % key)
+            if key + 1 not in self.keys:
+                self.assertIsNone(self.tree.search(key + 1)[0])
+        self.assertEqual(self.tree.size(), 1000)
+        self.assertEqual(self.tree.get_key(self.tree.max_node()), self.keys[-1])
+
+    def test_rank_and_ranges(self):
+        """Test rank, count_range and range scans against the source tree."""
+        for key in random.sample(range(-10 ** 12, 10 ** 12), 200) + self.keys[:50] + [self.keys[-1] + 1]:
+            self.assertEqual(self.tree.rank(key), self.source.rank(key))
+        lo, hi = self.keys[100], self.keys[200]
+        self.assertEqual(list(self.tree.items(lo, hi)), list(self.source.items(lo, hi)))
+        self.assertEqual(list(self.tree.keys(lo, hi, inclusive=(False, False), reverse=True, limit=5)),
+                         list(self.source.keys(lo, hi, inclusive=(False, False), reverse=True, limit=5)))
+        self.assertEqual(self.tree.count_range(lo, hi), 101)
+        self.assertEqual(self.tree.avl_to_array(), self.source.avl_to_array())
+        self.assertEqual(self.tree.get_key(self.tree.select(-1)), self.keys[-1])
+
+    def test_sizes_and_value_types(self):
+        """Test every tree size up to a few levels, and pickled values."""
+        for n in range(40):
+            source = AVLTree.from_sorted((key * 2, (key, None)) for key in range(n))
+            path = os.path.join(self.directory, "small.frozen")
+            with FrozenAVLTree.freeze(source, path) as tree:
+                self.assertEqual(tree.avl_to_array(), source.avl_to_array())
+                for key in range(-1, 2 * n + 1):
+                    node, _ = tree.search(key)
+                    self.assertEqual(node, key // 2 if key % 2 == 0 and 0 <= key < 2 * n else None)
+                    self.assertEqual(tree.rank(key), source.rank(key))
+            os.remove(path)
+
+    def test_rejects_other_files(self):
+        """Test that non-int keys and foreign files are refused."""
+        self.assertRaises(TypeError, FrozenAVLTree.freeze, AVLTree.from_sorted([("a", "")]),
+                          os.path.join(self.directory, "bad"))
+        path = os.path.join(self.directory, "bad")
+        with open(path, "wb") as file:
+            file.write(b"x" * 64)
+        self.assertRaises(ValueError, FrozenAVLTree, path)
+        os.remove(path)
+
+if __name__ == "__main__":
+    unittest.main()
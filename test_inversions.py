@@ -0,0 +1,25 @@
+import random
+import unittest
+from test import count_inversions, count_inversions_direct
+
+class TestCountInversions(unittest.TestCase):
+
+    def test_matches_direct_count(self):
+        """Test the merge sort count against the O(n^2) count, with and without duplicates."""
+        rng = random.Random(9)
+        for n in (0, 1, 2, 31, 32, 33, 64, 100, 500):
+            distinct = list(range(n))
+            rng.shuffle(distinct)
+            repeated = [rng.randrange(max(n // 4, 1)) for _ in range(n)]
+            for array in (distinct, repeated, sorted(repeated), sorted(repeated, reverse=True)):
+                self.assertEqual(count_inversions(array), count_inversions_direct(array))
+
+    def test_extremes(self):
+        """Test sorted, reversed and constant arrays."""
+        n = 1000
+        self.assertEqual(count_inversions(list(range(n))), 0)
+        self.assertEqual(count_inversions(list(range(n))[::-1]), n * (n - 1) // 2)
+        self.assertEqual(count_inversions([7] * n), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import random
+import unittest
+from AVLTree import AVLTree
+from PersistentAVLTree import PersistentAVLTree
+
+class TestPersistentAVLTree(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an empty persistent AVL tree before each test."""
+        self.tree = PersistentAVLTree()
+
+    def check_invariants(self, tree):
+        """Checks order, heights, sizes and balance of every node."""
+        def check(node):
+            if node is None:
+                return -1, 0
+            left_height, left_size = check(node.left)
+            right_height, right_size = check(node.right)
+            self.assertLessEqual(abs(left_height - right_height), 1)
+            self.assertEqual(node.height, 1 + max(left_height, right_height))
+            self.assertEqual(node.size, 1 + left_size + right_size)
+            return node.height, node.size
+        check(tree.get_root())
+        keys = [key for key, _ in tree.avl_to_array()]
+        self.assertEqual(keys, sorted(set(keys)))
+        self.assertEqual(tree.size(), len(keys))
+
+    def test_insert_and_search(self):
+        """Test insertion, value replacement and search."""
+        self.tree.insert(10, "A")
+        self.tree.insert(20, "B")
+        self.tree.insert(10, "C")
+        self.assertEqual(self.tree.search(10)[0].value, "C")
+        self.assertIsNone(self.tree.search(40)[0])
+        self.assertEqual(self.tree.size(), 2)
+
+    def test_same_edges_as_avl_tree(self):
+        """Test search reports the same e as the pointer-based tree."""
+        random.seed(0)
+        tree = AVLTree()
+        for key in random.sample(range(10000), 2000):
+            self.tree.insert(key, "")
+            tree.insert(key, "")
+        for key in random.sample(range(10000), 200):
+            self.assertEqual(self.tree.search(key)[1], tree.search(key)[1])
+
+    def test_random_inserts_and_deletes(self):
+        """Test random sequences of insertions and deletions against a dict."""
+        random.seed(1)
+        expected = {}
+        for _ in range(2000):
+            key = random.randrange(300)
+            if key in expected and random.random() < 0.5:
+                self.tree.delete(self.tree.search(key)[0])
+                del expected[key]
+            else:
+                self.tree.insert(key, str(key))
+                expected[key] = str(key)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.avl_to_array(), sorted(expected.items()))
+        self.assertEqual(self.tree.max_node().key, max(expected))
+
+    def test_snapshots_do_not_change(self):
+        """Test that snapshots keep their version while the tree changes, and are read-only."""
+        versions = []
+        for key in range(200):
+            self.tree.insert(key, key)
+            if key % 50 == 49:
+                versions.append((self.tree.snapshot(), self.tree.avl_to_array()))
+        for key in range(0, 200, 3):
+            self.tree.delete(self.tree.search(key)[0])
+        for snapshot, items in versions:
+            self.assertEqual(snapshot.avl_to_array(), items)
+            self.check_invariants(snapshot)
+            self.assertTrue(snapshot.is_snapshot())
+            self.assertRaises(TypeError, snapshot.insert, 1000, 0)
+        self.check_invariants(self.tree)
+        self.assertEqual(self.tree.size(), 200 - 67)
+
+    def test_updates_copy_only_the_path(self):
+        """Test that an insert shares all nodes but O(log n) with the previous version."""
+        self.tree = PersistentAVLTree.from_sorted((key, "") for key in range(0, 2000, 2))
+        snapshot = self.tree.snapshot()
+        self.tree.insert(1001, "")
+        def nodes(node):
+            return set() if node is None else {id(node)} | nodes(node.left) | nodes(node.right)
+        old, new = nodes(snapshot.get_root()), nodes(self.tree.get_root())
+        self.assertLessEqual(len(new - old), 2 * (self.tree.get_root().height + 1))
+
+    def test_split_and_join(self):
+        """Test split leaves the tree alone and join puts the parts back together."""
+        self.tree = PersistentAVLTree.from_sorted((key, str(key)) for key in range(500))
+        left, right = self.tree.split(self.tree.search(137)[0])
+        self.check_invariants(left)
+        self.check_invariants(right)
+        self.assertEqual(list(left), list(range(137)))
+        self.assertEqual(list(right), list(range(138, 500)))
+        self.assertEqual(self.tree.size(), 500)
+
+        right.join(left, 137, "137")
+        self.check_invariants(right)
+        self.assertEqual(right.avl_to_array(), self.tree.avl_to_array())
+
+        small = PersistentAVLTree()
+        small.insert(1000, "")
+        right.join(small, 700, "")
+        self.check_invariants(right)
+        self.assertEqual(right.size(), 502)
+
+if __name__ == "__main__":
+    unittest.main()